@@ -0,0 +1,119 @@
+"""Messages per second through Bot.on_message, before and after the fast path
+
+Replays seeded guild chat where about 1% of messages are commands through the
+bot's real on_message and get_prefix_list, with config and command processing
+replaced by in-memory stand-ins so only the dispatch path itself is measured.
+The "before" path is the previous on_message, kept here for comparison.
+
+    python -m benchmarks.dispatch [messages]
+"""
+
+import asyncio
+import random
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+import bot
+from bot.ext import config
+from bot.utils import prefixes
+from discord.utils import get
+
+user_id = 755580145078632508
+guild_ids = range(1000, 1050)
+
+
+class FakeConfig:
+    def __init__(self):
+        self.values = {guild_id: "!" for guild_id in guild_ids}
+
+    async def get_value(self, guild, configurable):
+        await asyncio.sleep(0)
+        return self.values[guild.id]
+
+
+class FakeBot:
+    """Just enough of Bot for on_message and get_prefix_list to run"""
+
+    def __init__(self):
+        self.user = SimpleNamespace(id=user_id, mention=f"<@{user_id}>")
+        self.prefixes = prefixes.PrefixMatcher()
+        self.mention_pattern = None
+        self.config = FakeConfig()
+        self.commands_seen = 0
+
+    def get_cog(self, name):
+        return self.config
+
+    async def get_prefix_list(self, _, message):
+        return await bot.Bot.get_prefix_list(self, self, message)
+
+    async def process_commands(self, message):
+        prefix_list = await self.get_prefix_list(self, message)
+        if message.content.startswith(tuple(prefix_list)):
+            self.commands_seen += 1
+
+
+async def previous_on_message(self, message):
+    if message.author.bot:
+        return
+
+    if re.fullmatch(rf"<@!?{self.user.id}>", message.content):
+        await self.get_cog("Config").get_value(
+            message.guild, get(config.configurables, name="prefix")
+        )
+
+    await self.process_commands(message)
+
+
+def build_messages(message_count: int):
+    rng = random.Random(0)
+    words = "hey hi lol ok yeah no the bot is down again can someone help".split()
+    guilds = [SimpleNamespace(id=guild_id) for guild_id in guild_ids]
+    author = SimpleNamespace(bot=False)
+
+    messages = []
+    for _ in range(message_count):
+        roll = rng.random()
+        if roll < 0.01:
+            content = f"!{rng.choice(['ban', 'warn', 'history get'])} 123"
+        elif roll < 0.02:
+            content = f"<@{user_id}> hello"
+        else:
+            content = " ".join(rng.choices(words, k=rng.randint(1, 12)))
+
+        messages.append(
+            SimpleNamespace(author=author, guild=rng.choice(guilds), content=content)
+        )
+
+    return messages
+
+
+async def measure(on_message, messages):
+    fake_bot = FakeBot()
+
+    start = time.perf_counter()
+    for message in messages:
+        await on_message(fake_bot, message)
+    elapsed = time.perf_counter() - start
+
+    return len(messages) / elapsed, fake_bot.commands_seen
+
+
+async def main(message_count: int = 200_000):
+    messages = build_messages(message_count)
+
+    before, before_commands = await measure(previous_on_message, messages)
+    after, after_commands = await measure(bot.Bot.on_message, messages)
+
+    assert before_commands == after_commands, "fast path skipped commands"
+
+    print(f"messages:  {message_count} ({after_commands} commands)")
+    print(f"before:    {before:,.0f} messages/sec")
+    print(f"after:     {after:,.0f} messages/sec")
+    print(f"speedup:   {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,140 @@
+"""Compares full text and delta storage of message versions
+
+Needs a scratch database in DATABASE_DSN, only temporary tables are used.
+
+    python -m benchmarks.history_storage [messages] [edits]
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+from os import environ
+
+import asyncpg
+import dotenv
+
+from bot.utils import versions
+
+words = (
+    "the quick brown fox jumps over lazy dog discord server message bot role"
+    " channel moderator please read rules before posting here thanks everyone"
+).split()
+
+
+def generate_versions(rng: random.Random, edits: int):
+    content = [rng.choice(words) for _ in range(rng.randint(50, 600))]
+    contents = [" ".join(content)]
+
+    for _ in range(edits):
+        for _ in range(rng.randint(1, 5)):
+            index = rng.randrange(len(content))
+            operation = rng.choice(("replace", "insert", "delete"))
+            if operation == "replace":
+                content[index] = rng.choice(words)
+            elif operation == "insert":
+                content.insert(index, rng.choice(words))
+            elif len(content) > 1:
+                del content[index]
+
+        contents.append(" ".join(content))
+
+    return contents
+
+
+def build_records(messages: list, *, delta: bool):
+    records = []
+
+    for message_id, contents in enumerate(messages):
+        previous = None
+        for version, content in enumerate(contents):
+            records.append(
+                (
+                    message_id,
+                    version,
+                    *versions.encode_version(previous, content, version, delta=delta),
+                )
+            )
+            previous = content
+
+    return records
+
+
+async def measure(conn, table: str, messages: list, *, delta: bool, samples: int):
+    await conn.execute(
+        f"""
+        CREATE TEMPORARY TABLE {table} (
+          message_id BIGINT NOT NULL,
+          version INT NOT NULL,
+          content TEXT,
+          content_delta BYTEA,
+          PRIMARY KEY (message_id, version)
+        )
+        """
+    )
+    await conn.copy_records_to_table(
+        table,
+        columns=("message_id", "version", "content", "content_delta"),
+        records=build_records(messages, delta=delta),
+    )
+    await conn.execute(f"VACUUM ANALYZE {table}")
+
+    size = await conn.fetchval(f"SELECT pg_total_relation_size('{table}')")
+
+    rng = random.Random(1)
+    timings = []
+    for _ in range(samples):
+        message_id = rng.randrange(len(messages))
+        version = rng.randrange(len(messages[message_id]))
+
+        start = time.perf_counter()
+        rows = await conn.fetch(
+            f"""
+            SELECT version, content, content_delta FROM {table}
+            WHERE message_id = $1
+            AND version BETWEEN $2 AND $3
+            ORDER BY version
+            """,
+            message_id,
+            versions.keyframe(version),
+            version,
+        )
+        content = versions.decode_versions(rows)[version]
+        timings.append(time.perf_counter() - start)
+
+        assert content == messages[message_id][version]
+
+    timings.sort()
+    return size, statistics.mean(timings), timings[int(len(timings) * 0.95)]
+
+
+async def main(message_count: int = 2000, edits: int = 12):
+    dotenv.load_dotenv()
+
+    rng = random.Random(0)
+    messages = [generate_versions(rng, edits) for _ in range(message_count)]
+
+    conn = await asyncpg.connect(environ.get("DATABASE_DSN"))
+    try:
+        results = {
+            "full": await measure(
+                conn, "bench_history_full", messages, delta=False, samples=1000
+            ),
+            "delta": await measure(
+                conn, "bench_history_delta", messages, delta=True, samples=1000
+            ),
+        }
+    finally:
+        await conn.close()
+
+    print(f"{message_count} messages with {edits} edits each")
+    for mode, (size, mean, p95) in results.items():
+        print(
+            f"{mode:>6}: {size / 1024 ** 2:8.2f} MiB,"
+            f" reconstruct avg {mean * 1000:.3f}ms p95 {p95 * 1000:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:3])))
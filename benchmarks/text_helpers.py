@@ -0,0 +1,146 @@
+"""Benchmarks for the text helpers in bot.utils
+
+Runs offline on generated corpora, reporting operations per second and
+peak memory per call. Results are compared against benchmarks/baseline.json
+when it exists, exiting with status 1 if any case got slower than the allowed
+tolerance.
+
+    python -m benchmarks.text_helpers [--save] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import pathlib
+import random
+import sys
+import timeit
+import tracemalloc
+
+from bot.utils import cut_words, diff_message, escape, wrap_in_code
+
+baseline_path = pathlib.Path(__file__).with_name("baseline.json")
+
+chat_words = (
+    "hey hi lol ok yeah no idea what why how does this work the bot is down"
+    " again can someone help me with webhooks embeds please thanks"
+).split()
+emoji = ("<:pepe:123456789012345678>", "<a:party:234567890123456789>", "😂", "👍🏽")
+
+
+def short_chat(rng: random.Random):
+    return " ".join(rng.choice(chat_words) for _ in range(rng.randint(3, 15)))
+
+
+def copypasta(rng: random.Random):
+    return " ".join(rng.choice(chat_words[:8]) for _ in range(700))
+
+
+def emoji_heavy(rng: random.Random):
+    return " ".join(
+        rng.choice(emoji) if rng.random() < 0.6 else rng.choice(chat_words)
+        for _ in range(60)
+    )
+
+
+def code_block(rng: random.Random):
+    lines = [
+        f"    {rng.choice(('const', 'let'))} value_{index} = `*{index}*` // _note_"
+        for index in range(40)
+    ]
+    return "```js\n" + "\n".join(lines) + "\n```"
+
+
+def edit(rng: random.Random, text: str, changes: int):
+    words = text.split(" ")
+    for _ in range(changes):
+        index = rng.randrange(len(words))
+        words[index] = rng.choice(chat_words).upper()
+    return " ".join(words)
+
+
+def build_cases():
+    rng = random.Random(0)
+
+    corpora = {
+        "short_chat": short_chat(rng),
+        "copypasta": copypasta(rng),
+        "emoji": emoji_heavy(rng),
+        "code_block": code_block(rng),
+    }
+
+    cases = {}
+    for name, text in corpora.items():
+        cases[f"wrap_in_code/{name}"] = lambda text=text: wrap_in_code(text)
+        cases[f"escape/{name}"] = lambda text=text: escape(text)
+        cases[f"cut_words/{name}"] = lambda text=text: cut_words(text, 250)
+
+        edited = edit(rng, text, 3)
+        cases[f"diff_message/{name}"] = lambda a=text, b=edited: diff_message(
+            a, b, max_len=250
+        )
+
+    huge = copypasta(rng) * 6
+    huge_edited = edit(rng, huge, 400)
+    cases["diff_message/huge_edit"] = lambda: diff_message(
+        huge, huge_edited, max_len=250
+    )
+    cases["diff_message/huge_edit_full"] = lambda: diff_message(huge, huge_edited)
+
+    return cases
+
+
+def measure(case):
+    timer = timeit.Timer(case)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=5, number=number)) / number
+
+    # Peak traced memory while the call runs, blocks freed before it returns
+    # are included, unlike with a snapshot taken afterwards
+    tracemalloc.start()
+    case()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops_per_sec": 1 / seconds, "peak_bytes": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save", action="store_true", help="store as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    baseline = {}
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+
+    results = {}
+    regressions = []
+
+    print(f"{'case':<32} {'ops/sec':>12} {'peak bytes':>12}")
+    for name, case in build_cases().items():
+        result = results[name] = measure(case)
+
+        flag = ""
+        if name in baseline:
+            ratio = result["ops_per_sec"] / baseline[name]["ops_per_sec"]
+            flag = f" {ratio:6.2f}x"
+            if ratio < 1 - args.tolerance:
+                flag += " REGRESSION"
+                regressions.append(name)
+
+        print(
+            f"{name:<32} {result['ops_per_sec']:>12.1f}"
+            f" {result['peak_bytes']:>12}{flag}"
+        )
+
+    if args.save:
+        baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {baseline_path}")
+
+    if regressions and not args.save:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
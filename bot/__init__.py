@@ -1,3 +1,4 @@
+import collections
 import re
 from os import environ
 
@@ -5,10 +6,9 @@ import aiohttp
 import asyncpg
 import discord
 from discord.ext import commands
-from discord.utils import get
 
 from bot.ext import config
-from bot.utils import wrap_in_code
+from bot.utils import dispatcher, metrics, prefixes, resolver, wrap_in_code
 
 initial_extensions = (
     "jishaku",
@@ -17,6 +17,8 @@ initial_extensions = (
     "bot.ext.meta",
     "bot.ext.help",
     "bot.ext.logger",
+    "bot.ext.retention",
+    "bot.ext.stats",
     "bot.ext.moderation",
     "bot.ext.filter",
     "bot.ext.roles",
@@ -39,6 +41,12 @@ class Bot(commands.AutoShardedBot):
             max_messages=None,
         )
 
+        self.metrics = collections.defaultdict(metrics.Metrics)
+        self.user_resolver = resolver.UserResolver(self)
+        self.log_dispatcher = dispatcher.LogDispatcher(self)
+        self.prefixes = prefixes.PrefixMatcher()
+        self.mention_pattern = None
+
         for extension in initial_extensions:
             self.load_extension(extension)
 
@@ -51,7 +59,7 @@ class Bot(commands.AutoShardedBot):
         if message.guild:
             custom_prefix = await self.get_cog("Config").get_value(
                 message.guild,
-                get(config.configurables, name="prefix"),
+                config.configurables_by_name["prefix"],
             )
 
             if custom_prefix:
@@ -68,21 +76,58 @@ class Bot(commands.AutoShardedBot):
         await super().start(*args, **kwargs)
 
     async def close(self):
+        logger = self.get_cog("Logger")
+        if logger:
+            await logger.ingest.flush()
+            logger.renderer.shutdown()
+
+        await self.log_dispatcher.flush()
+
+        stats = self.get_cog("Stats")
+        if stats:
+            await stats.flush()
+
         await self.session.close()
         await super().close()
 
     async def on_ready(self):
         print(f"Ready as {self.user} ({self.user.id})")
 
+    async def on_config_update(self, guild, configurable):
+        if configurable is None or configurable.name == "prefix":
+            self.prefixes.invalidate(guild.id)
+
+    async def on_guild_remove(self, guild):
+        self.prefixes.invalidate(guild.id)
+
     async def on_message(self, message):
         if message.author.bot:
             return
 
-        if re.fullmatch(rf"<@!?{self.user.id}>", message.content):
+        # Most messages aren't commands, those return here without waiting on
+        # anything once the guild's prefix is known
+        guild_id = message.guild.id if message.guild else None
+        might_be_command = self.prefixes.might_be_command(guild_id, message.content)
+        if might_be_command is None:
+            self.prefixes.set_prefix(
+                guild_id,
+                await self.get_cog("Config").get_value(
+                    message.guild, config.configurables_by_name["prefix"]
+                ),
+            )
+            might_be_command = self.prefixes.might_be_command(guild_id, message.content)
+
+        if not might_be_command:
+            return
+
+        if self.mention_pattern is None:
+            self.mention_pattern = re.compile(rf"<@!?{self.user.id}>")
+
+        if self.mention_pattern.fullmatch(message.content):
             prefix = None
             if message.guild:
                 prefix = await self.get_cog("Config").get_value(
-                    message.guild, get(config.configurables, name="prefix")
+                    message.guild, config.configurables_by_name["prefix"]
                 )
 
             prefix_md = wrap_in_code(prefix) if prefix else self.user.mention
@@ -1,13 +1,25 @@
 import asyncio
 import collections
 import re
+import sys
+import time
+import typing
+import uuid
 from os import environ
 
 import asyncpg
 import discord
 import lru
-from discord.ext import commands
-from discord.utils import get
+from discord.ext import commands, tasks
+
+# Either "lru" to keep the config of recently active guilds, or "preload" to
+# load every guild's config at startup and keep it, other processes invalidate
+# entries through NOTIFY when they change them
+cache_mode = environ.get("GUILD_CONFIG_CACHE", "lru")
+notify_channel = "guild_config"
+
+# Seconds before a guild whose config failed to load is queried again
+failure_backoff = 5.0
 
 Configurable = collections.namedtuple(
     "Configurable",
@@ -65,16 +77,59 @@ configurables = [
         required=False,
         type=discord.TextChannel,
     ),
+    Configurable(
+        name="message-retention",
+        description="Days after which stored messages are deleted.",
+        column="message_retention_days",
+        required=False,
+        type=int,
+    ),
+    Configurable(
+        name="excluded-channels",
+        description="Channels whose messages are not stored or logged.",
+        column="excluded_channel_ids",
+        required=False,
+        type=typing.List[discord.TextChannel],
+    ),
+    Configurable(
+        name="excluded-categories",
+        description="Categories whose messages are not stored or logged.",
+        column="excluded_category_ids",
+        required=False,
+        type=typing.List[discord.CategoryChannel],
+    ),
+    Configurable(
+        name="excluded-roles",
+        description="Roles whose members' messages are not stored or logged.",
+        column="excluded_role_ids",
+        required=False,
+        type=typing.List[discord.Role],
+    ),
 ]
 
 
+configurables_by_name = {
+    configurable.name: configurable for configurable in configurables
+}
+
+# Configurables whose values are IDs resolved to objects by Config.get_resolved
+resolved_types = (discord.TextChannel, discord.CategoryChannel, discord.Role)
+
+# Smallest values accepted for numeric configurables
+minimum_values = {"message-retention": 1}
+
+
 type_names = {
     str: "string",
     int: "integer",
     float: "number",
     bool: "boolean",
     discord.TextChannel: "text channel",
+    discord.CategoryChannel: "category",
     discord.Role: "role",
+    typing.List[discord.TextChannel]: "list of text channels",
+    typing.List[discord.CategoryChannel]: "list of categories",
+    typing.List[discord.Role]: "list of roles",
 }
 
 enabled_values = ("yes", "y", "true", "t", "1", "enable", "on")
@@ -87,6 +142,13 @@ def resolve_value(expected_type, user_input: str, required=True):
     if not required and lowered in disabled_values:
         return None
 
+    if typing.get_origin(expected_type) is list:
+        (item_type,) = typing.get_args(expected_type)
+        return [
+            resolve_value(item_type, item)
+            for item in re.split(r"[\s,]+", user_input.strip())
+        ]
+
     if expected_type is bool:
         if lowered in enabled_values:
             return True
@@ -117,42 +179,234 @@ class Config(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.cache = lru.LRU(256)
+        self.metrics = bot.metrics["guild_config"]
+
+        # Rows are kept as plain tuples, indexed through the shared column map.
+        # All writes go through put_row and drop_row to keep the size current.
+        self.cache = {} if cache_mode == "preload" else lru.LRU(256, self.on_evict)
+        self.columns = {}
+        self.resident_bytes = 0
+
+        # Values of ID configurables resolved to channels and roles, per guild
+        self.resolved = {}
+
+        # Loads in flight and when guilds whose load failed may be tried again
+        self.fetches = {}
+        self.failures = {}
+
+        # Tags our own notifications, so they don't invalidate what we just set
+        self.instance_id = uuid.uuid4().hex
+        self.listener = None
+
+        if cache_mode == "preload":
+            self.watch_config.start()
+
         super().__init__()
 
-    async def ensure(self, guild: discord.Guild):
-        if guild.id in self.cache:
-            return self.cache[guild.id]
+    def cog_unload(self):
+        self.watch_config.cancel()
+        if self.listener:
+            self.bot.loop.create_task(self.listener.close())
+
+        return super().cog_unload()
+
+    def store(self, row: asyncpg.Record):
+        if not self.columns:
+            self.columns = {column: index for index, column in enumerate(row.keys())}
+
+        self.put_row(row["guild_id"], tuple(row.values()))
 
-        row = await self.bot.db.fetchrow(
+    @staticmethod
+    def row_size(row: tuple):
+        return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+    def put_row(self, guild_id: int, row: tuple):
+        self.drop_row(guild_id)
+        self.cache[guild_id] = row
+        self.resident_bytes += self.row_size(row)
+
+    def drop_row(self, guild_id: int):
+        # lru-dict 1.1.6 has no pop, and del doesn't call on_evict
+        if guild_id in self.cache:
+            row = self.cache[guild_id]
+            del self.cache[guild_id]
+            self.resident_bytes -= self.row_size(row)
+
+    def on_evict(self, guild_id: int, row: tuple):
+        self.resident_bytes -= self.row_size(row)
+
+    def update_gauges(self):
+        self.metrics.set("entries", len(self.cache))
+        self.metrics.set("resident_bytes", self.resident_bytes)
+
+    async def preload(self):
+        rows = await self.bot.db.fetch(
             """
             SELECT * FROM guild_config
-            WHERE guild_id = $1
+            WHERE guild_id = ANY($1::BIGINT[])
             """,
-            guild.id,
+            [guild.id for guild in self.bot.guilds],
         )
-        if row:
-            self.cache[guild.id] = dict(row)
-            return await self.ensure(guild)
 
-        await self.bot.db.execute(
-            """
-            INSERT INTO guild_config (guild_id)
-            VALUES ($1)
-            ON CONFLICT DO NOTHING
-            """,
-            guild.id,
-        )
+        self.cache.clear()
+        self.resident_bytes = 0
+        for row in rows:
+            self.store(row)
+
+        self.metrics.incr("preloads")
+        self.update_gauges()
+
+    def on_notification(self, connection, pid: int, channel: str, payload: str):
+        instance_id, guild_id = payload.split()
+        if instance_id == self.instance_id:
+            return
+
+        self.metrics.incr("invalidations")
+        self.drop_row(int(guild_id))
+        self.update_gauges()
+
+        guild = self.bot.get_guild(int(guild_id))
+        if guild:
+            self.bot.dispatch("config_update", guild, None)
+
+    @tasks.loop(seconds=30)
+    async def watch_config(self):
+        if self.listener and not self.listener.is_closed():
+            return
+
+        # Notifications sent while not listening are lost, so everything is
+        # loaded again whenever the connection is (re)established
+        self.listener = await asyncpg.connect(environ.get("DATABASE_DSN"))
+        await self.listener.add_listener(notify_channel, self.on_notification)
+        await self.preload()
+
+    @watch_config.before_loop
+    async def before_watch_config(self):
+        await self.bot.wait_until_ready()
+
+    async def ensure(self, guild: discord.Guild):
+        start = time.perf_counter()
+
+        config = self.cache.get(guild.id)
+        if config is not None:
+            self.metrics.observe("ensure_hit", time.perf_counter() - start)
+            return config
+
+        if self.bot.loop.time() < self.failures.get(guild.id, 0):
+            self.metrics.incr("ensure_backoff")
+            raise RuntimeError(f"Config of guild {guild.id} failed to load recently")
+
+        fetch = self.fetches.get(guild.id)
+        outcome = "ensure_coalesced"
+        if fetch is None:
+            fetch = self.bot.loop.create_task(self.fetch(guild.id))
+            fetch.add_done_callback(lambda _: self.fetches.pop(guild.id, None))
+            self.fetches[guild.id] = fetch
+            outcome = "ensure_fetch"
+
+        try:
+            return await asyncio.shield(fetch)
+        finally:
+            self.metrics.observe(outcome, time.perf_counter() - start)
+
+    async def fetch(self, guild_id: int):
+        try:
+            # Inserted rows aren't visible to the second SELECT of the same
+            # statement, so exactly one of them returns the row
+            row = await self.bot.db.fetchrow(
+                """
+                WITH inserted AS (
+                    INSERT INTO guild_config (guild_id)
+                    VALUES ($1)
+                    ON CONFLICT DO NOTHING
+                    RETURNING *
+                )
+                SELECT * FROM inserted
+                UNION ALL
+                SELECT * FROM guild_config WHERE guild_id = $1
+                """,
+                guild_id,
+            )
+
+            # A concurrent insert from another process committed after this
+            # statement started, the row is visible to a new one
+            if row is None:
+                row = await self.bot.db.fetchrow(
+                    """
+                    SELECT * FROM guild_config
+                    WHERE guild_id = $1
+                    """,
+                    guild_id,
+                )
+        except Exception:
+            self.failures[guild_id] = self.bot.loop.time() + failure_backoff
+            raise
 
-        return await self.ensure(guild)
+        self.failures.pop(guild_id, None)
+        self.store(row)
+        self.update_gauges()
+        return self.cache[guild_id]
 
     async def get_value(
         self,
         guild: discord.Guild,
         configurable: Configurable,
     ):
+        self.metrics.incr("hits" if guild.id in self.cache else "misses")
+        hits = self.metrics.counters["hits"]
+        self.metrics.set(
+            "hit_rate", f"{hits / (hits + self.metrics.counters['misses']):.2%}"
+        )
+
         config = await self.ensure(guild)
-        return config[configurable.column]
+        return config[self.columns[configurable.column]]
+
+    async def get_resolved(self, guild: discord.Guild, name: str):
+        """Gets the channel or role a configurable is set to, None if it's gone"""
+
+        guild_resolved = self.resolved.setdefault(guild.id, {})
+        if name in guild_resolved:
+            self.metrics.incr("resolved_hits")
+            return guild_resolved[name]
+
+        self.metrics.incr("resolved_misses")
+        configurable = configurables_by_name[name]
+        value = await self.get_value(guild, configurable)
+
+        if value is not None:
+            if configurable.type is discord.Role:
+                value = guild.get_role(value)
+            else:
+                value = guild.get_channel(value)
+
+        # The guild's entries may have been dropped while waiting on the value
+        self.resolved.setdefault(guild.id, {})[name] = value
+        return value
+
+    def invalidate_resolved(self, guild: discord.Guild):
+        self.resolved.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_config_update(self, guild: discord.Guild, configurable):
+        if configurable is None or configurable.type in resolved_types:
+            self.invalidate_resolved(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.invalidate_resolved(channel.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.invalidate_resolved(role.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # Channels and roles are new objects after a guild comes back
+        self.invalidate_resolved(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.invalidate_resolved(guild)
 
     async def set_value(
         self,
@@ -160,30 +414,51 @@ class Config(commands.Cog):
         configurable: Configurable,
         new_value,
     ):
-        config = await self.ensure(guild)
+        minimum = minimum_values.get(configurable.name)
+        if minimum is not None and new_value is not None and new_value < minimum:
+            raise RuntimeError(f"{new_value!r} is below the minimum of {minimum}")
 
-        config[configurable.column] = new_value
+        config = list(await self.ensure(guild))
+        config[self.columns[configurable.column]] = new_value
+        self.put_row(guild.id, tuple(config))
 
         await self.bot.db.execute(
             f"""
-            UPDATE guild_config
-            SET {configurable.column} = $2
-            WHERE guild_id = $1
+            WITH updated AS (
+                UPDATE guild_config
+                SET {configurable.column} = $2
+                WHERE guild_id = $1
+                RETURNING guild_id
+            )
+            SELECT pg_notify($3, $4) FROM updated
             """,
             guild.id,
             new_value,
+            notify_channel,
+            f"{self.instance_id} {guild.id}",
         )
 
+        self.bot.dispatch("config_update", guild, configurable)
+
     async def delete_data(self, guild: discord.Guild):
         await self.bot.db.execute(
-            f"""
-            DELETE FROM guild_config
-            WHERE guild_id = $1
+            """
+            WITH deleted AS (
+                DELETE FROM guild_config
+                WHERE guild_id = $1
+                RETURNING guild_id
+            )
+            SELECT pg_notify($2, $3) FROM deleted
             """,
             guild.id,
+            notify_channel,
+            f"{self.instance_id} {guild.id}",
         )
 
-        del self.cache[guild.id]
+        self.drop_row(guild.id)
+        self.update_gauges()
+
+        self.bot.dispatch("config_update", guild, None)
 
 
 def setup(bot: commands.Bot):
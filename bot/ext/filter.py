@@ -1,8 +1,8 @@
 import re
+import typing
 
 import discord
 from discord.ext import commands
-from discord.utils import get
 
 message_filters = [
     (
@@ -21,36 +21,85 @@ class Filter(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.metrics = bot.metrics["filter"]
         super().__init__()
 
-    async def filter(self, message: discord.Message):
+    async def filter(
+        self,
+        message: typing.Union[discord.Message, discord.PartialMessage],
+        author: typing.Union[discord.Member, discord.User],
+        content: str,
+    ):
+        """Removes the message if its content matches a filter, returns if it did"""
+
         if (
-            message.author.bot
-            or not message.guild
-            or message.channel.permissions_for(message.author).manage_messages
+            author.bot
+            or not isinstance(author, discord.Member)
+            or message.channel.permissions_for(author).manage_messages
         ):
-            return
+            return False
 
         for (pattern, error) in message_filters:
-            if pattern.search(message.content):
+            if pattern.search(content):
                 await message.delete()
                 await message.channel.send(
                     embed=discord.Embed(title="Message filter", description=error),
                     delete_after=5.0,
                 )
+                return True
+
+        return False
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        await self.filter(message)
+        await self.filter(message, message.author, message.content)
 
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
-        channel = self.bot.get_channel(payload.channel_id)
-        if not channel:
-            channel = await self.bot.fetch_channel(payload.channel_id)
+        self.metrics.incr("edits")
+
+        # Embeds being resolved and other updates without content can't change
+        # what the filters match
+        content = payload.data.get("content")
+        if content is None or "guild_id" not in payload.data:
+            self.metrics.incr("edits_skipped")
+            return
+
+        http_calls = 0
+
+        message = payload.cached_message
+        author = message.author if message else None
+
+        if author is None:
+            author_data = payload.data.get("author", {})
+            if author_data.get("bot") or "webhook_id" in payload.data:
+                self.metrics.incr("edits_skipped")
+                return
+
+            channel = self.bot.get_channel(payload.channel_id)
+            if channel and "id" in author_data:
+                author = channel.guild.get_member(int(author_data["id"]))
+                message = channel.get_partial_message(payload.message_id)
+
+        # Only without the author cached is the full message needed
+        if author is None:
+            channel = self.bot.get_channel(payload.channel_id)
+            if not channel:
+                channel = await self.bot.fetch_channel(payload.channel_id)
+                http_calls += 1
+
+            message = await channel.fetch_message(payload.message_id)
+            author = message.author
+            http_calls += 1
+
+        if await self.filter(message, author, content):
+            http_calls += 2
 
-        message = await channel.fetch_message(payload.message_id)
-        await self.filter(message)
+        self.metrics.incr("http_calls", http_calls)
+        edits = self.metrics.counters["edits"]
+        self.metrics.set(
+            "http_calls_per_edit", f"{self.metrics.counters['http_calls'] / edits:.3f}"
+        )
 
 
 def setup(bot: commands.Bot):
@@ -1,13 +1,54 @@
+import asyncio
 import collections
 import difflib
+import gzip
+import io
+import itertools
+import json
 import re
+import tempfile
+import typing
+import weakref
 from datetime import datetime, timedelta
+from os import environ
 
 import discord
 from bot.ext import config
-from bot.utils import cut_words, diff_message, escape
-from discord.ext import commands
-from discord.utils import get
+from bot.utils import (
+    audit,
+    cache,
+    converter,
+    cut_words,
+    deletions,
+    escape,
+    exclusions,
+    ingest,
+    members,
+    paginators,
+    render,
+    snowflake_range,
+    versions,
+)
+from discord.ext import commands, tasks
+
+# Either "full" to store every message version as is, or "delta" to store
+# versions between keyframes compressed against the version before them
+history_storage = environ.get("MESSAGE_HISTORY_STORAGE", "full")
+
+# Edits longer than LOG_RENDER_OFFLOAD_CHARS (old and new content combined) are
+# diffed in one of LOG_RENDER_WORKERS processes, 0 renders everything inline
+render_workers = int(environ.get("LOG_RENDER_WORKERS", 2))
+render_offload_chars = int(environ.get("LOG_RENDER_OFFLOAD_CHARS", 4000))
+render_timeout = float(environ.get("LOG_RENDER_TIMEOUT", 2.0))
+
+exclusion_configurables = (
+    "excluded-channels",
+    "excluded-categories",
+    "excluded-roles",
+)
+
+# Rows read per round trip by history export
+export_chunk_rows = 1000
 
 
 class Logger(commands.Cog):
@@ -15,13 +56,174 @@ class Logger(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.ingest = ingest.MessageIngest(bot)
+        self.audit_logs = audit.AuditLogCache(bot)
+        self.member_index = members.MemberIndex()
+        self.message_cache = cache.MessageCache(bot.metrics["message_cache"])
+        self.recent_deletions = deletions.DeletionBuffer(bot.metrics["deletions"])
+        self.exclusions = {}
+        self.edit_locks = weakref.WeakValueDictionary()
+        self.renderer = render.RenderPool(
+            bot,
+            workers=render_workers,
+            offload_chars=render_offload_chars,
+            timeout=render_timeout,
+        )
+        self.flush_messages.start()
         super().__init__()
 
+    def cog_unload(self):
+        # Stopped rather than cancelled so a batch being written isn't lost,
+        # whatever is still buffered is written after it
+        self.flush_messages.stop()
+        self.bot.loop.create_task(self.ingest.flush())
+        self.renderer.shutdown()
+        return super().cog_unload()
+
     async def get_log_channel(self, guild: discord.Guild, log_type: str):
         cfg = self.bot.get_cog("Config")
-        configurable = get(config.configurables, name=f"{log_type}-logs")
-        channel_id = await cfg.get_value(guild, configurable)
-        return get(guild.channels, id=channel_id)
+        return await cfg.get_resolved(guild, f"{log_type}-logs")
+
+    async def get_exclusions(self, guild: discord.Guild):
+        guild_exclusions = self.exclusions.get(guild.id)
+        if guild_exclusions is None:
+            cfg = self.bot.get_cog("Config")
+            guild_exclusions = self.exclusions[guild.id] = exclusions.Exclusions(
+                *[
+                    await cfg.get_value(guild, config.configurables_by_name[name]) or ()
+                    for name in exclusion_configurables
+                ]
+            )
+
+        return guild_exclusions
+
+    async def is_excluded(self, channel_id: int, role_ids: typing.Iterable[int] = ()):
+        """Checks exclusions for raw events, which only carry IDs"""
+
+        channel = self.bot.get_channel(channel_id)
+        if not isinstance(channel, discord.abc.GuildChannel):
+            return False
+
+        guild_exclusions = await self.get_exclusions(channel.guild)
+        if guild_exclusions and (
+            guild_exclusions.excludes_channel(channel)
+            or guild_exclusions.excludes_roles(role_ids)
+        ):
+            self.bot.metrics["ingest"].incr("excluded")
+            return True
+
+        return False
+
+    def record_activity(
+        self,
+        kind: str,
+        guild_id: int,
+        channel_id: int,
+        author_id: int,
+        when: typing.Optional[datetime] = None,
+    ):
+        stats = self.bot.get_cog("Stats")
+        if stats:
+            stats.record(kind, guild_id, channel_id, author_id, when)
+
+    async def get_latest_version(self, message_id: int):
+        latest_versions = await self.get_latest_versions([message_id])
+        return latest_versions.get(message_id)
+
+    async def get_latest_versions(self, message_ids: typing.Iterable[int]):
+        latest_versions = {}
+        missing = []
+
+        for message_id in message_ids:
+            cached = self.message_cache.get(message_id)
+            if cached:
+                latest_versions[message_id] = cached
+            else:
+                missing.append(message_id)
+
+        if not missing:
+            return latest_versions
+
+        if any(self.ingest.is_pending(message_id) for message_id in missing):
+            await self.ingest.flush()
+
+        rows = await self.bot.db.fetch(
+            """
+            SELECT
+                message_metadata.message_id,
+                message_metadata.author_id,
+                message_history.version,
+                message_history.content,
+                message_history.content_delta
+            FROM message_metadata
+            JOIN message_history ON (
+                message_history.message_id = message_metadata.message_id
+                AND message_history.version
+                BETWEEN (message_metadata.version_count - 1) / $2 * $2
+                AND message_metadata.version_count - 1
+            )
+            WHERE message_metadata.message_id = ANY($1::BIGINT[])
+            ORDER BY message_metadata.message_id, message_history.version
+            """,
+            missing,
+            versions.keyframe_interval,
+        )
+
+        for message_id, message_rows in itertools.groupby(
+            rows, key=lambda row: row["message_id"]
+        ):
+            message_rows = list(message_rows)
+            contents = versions.decode_versions(message_rows)
+            latest = message_rows[-1]
+
+            if latest["version"] in contents:
+                latest_versions[message_id] = (
+                    latest["author_id"],
+                    contents[latest["version"]],
+                )
+
+        return latest_versions
+
+    async def get_versions(self, requested: typing.Iterable[typing.Tuple[int, int]]):
+        """Rebuilds content for (message_id, version) pairs
+
+        Returns a dict keyed by those pairs, pairs that can't be rebuilt are left out.
+        """
+
+        requested = list(requested)
+        if not requested:
+            return {}
+
+        message_ids, message_versions = zip(*requested)
+
+        rows = await self.bot.db.fetch(
+            """
+            SELECT
+                message_history.message_id,
+                message_history.version,
+                message_history.content,
+                message_history.content_delta
+            FROM unnest($1::BIGINT[], $2::INT[]) AS requested (message_id, version)
+            JOIN message_history ON (
+                message_history.message_id = requested.message_id
+                AND message_history.version
+                BETWEEN requested.version / $3 * $3 AND requested.version
+            )
+            ORDER BY message_history.message_id, message_history.version
+            """,
+            message_ids,
+            message_versions,
+            versions.keyframe_interval,
+        )
+
+        contents = {}
+        for message_id, message_rows in itertools.groupby(
+            rows, key=lambda row: row["message_id"]
+        ):
+            for version, content in versions.decode_versions(message_rows).items():
+                contents[message_id, version] = content
+
+        return {key: contents[key] for key in requested if key in contents}
 
     @commands.group(invoke_without_command=True, aliases=["hist"])
     @commands.has_guild_permissions(manage_messages=True)
@@ -40,21 +242,39 @@ class Logger(commands.Cog):
         """Gets a message by its ID and it's version
 
         Versions start at zero, each indexed edit adds one.
+        Negative versions count back from the latest one, -1 being the latest.
         """
 
-        content_data = await self.bot.db.fetchrow(
+        rows = await self.bot.db.fetch(
             """
-            SELECT message_history.content, message_metadata.* FROM message_history
-            JOIN message_metadata ON (message_metadata.message_id = message_history.message_id)
-            WHERE message_history.message_id = $1
-            ORDER BY version_at
-            LIMIT 1 OFFSET $2
+            SELECT
+                message_history.version,
+                message_history.content,
+                message_history.content_delta,
+                message_metadata.*
+            FROM message_metadata
+            CROSS JOIN LATERAL (
+                SELECT CASE
+                    WHEN $2 < 0 THEN message_metadata.version_count + $2 ELSE $2
+                END AS target
+            ) requested
+            JOIN message_history ON (
+                message_history.message_id = message_metadata.message_id
+                AND message_history.version
+                BETWEEN requested.target / $3 * $3 AND requested.target
+            )
+            WHERE message_metadata.message_id = $1
+            ORDER BY message_history.version
             """,
             message_id,
             version,
+            versions.keyframe_interval,
         )
 
-        if not content_data:
+        content_data = rows[-1] if rows else None
+        contents = versions.decode_versions(rows)
+
+        if not content_data or content_data["version"] not in contents:
             await ctx.send(
                 embed=discord.Embed(
                     title="Message history",
@@ -64,20 +284,21 @@ class Logger(commands.Cog):
             return
 
         channel = self.bot.get_channel(content_data["channel_id"])
-        author = channel.guild.get_member(content_data["author_id"])
-        if not author:
-            author = await self.bot.fetch_user(content_data["author_id"])
+        author = await self.bot.user_resolver.resolve(
+            content_data["author_id"], guild=channel.guild
+        )
 
         embed = discord.Embed(
             title=f"Message {message_id}",
             url=f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}",
-            description=content_data["content"],
-        )
-        embed.set_author(
-            name=f"{author} \N{BULLET} {author.id}",
-            url=f"https://discord.com/users/{author.id}",
-            icon_url=author.avatar_url,
+            description=contents[content_data["version"]],
         )
+        if author:
+            embed.set_author(
+                name=f"{author} \N{BULLET} {author.id}",
+                url=f"https://discord.com/users/{author.id}",
+                icon_url=author.avatar_url,
+            )
 
         await ctx.send(embed=embed)
 
@@ -93,45 +314,50 @@ class Logger(commands.Cog):
         """Gets the difference between 2 message versions for a message by its ID and 2 versions
 
         Versions start at zero, each indexed edit adds one.
-        The new version parameter accepts magic value -1 as last message, other negative numbers are not supported.
+        Negative versions count back from the latest one, -1 being the latest.
         """
 
-        old_data = await self.bot.db.fetchrow(
+        rows = await self.bot.db.fetch(
             """
-            SELECT message_history.content, message_metadata.* FROM message_history
-            JOIN message_metadata ON (message_metadata.message_id = message_history.message_id)
-            WHERE message_history.message_id = $1
-            ORDER BY version_at
-            LIMIT 1 OFFSET $2
+            SELECT DISTINCT ON (message_history.version)
+                message_history.version,
+                message_history.content,
+                message_history.content_delta,
+                message_metadata.*
+            FROM message_metadata
+            CROSS JOIN LATERAL (
+                VALUES
+                    (CASE WHEN $2 < 0 THEN message_metadata.version_count + $2 ELSE $2 END),
+                    (CASE WHEN $3 < 0 THEN message_metadata.version_count + $3 ELSE $3 END)
+            ) requested (target)
+            JOIN message_history ON (
+                message_history.message_id = message_metadata.message_id
+                AND message_history.version
+                BETWEEN requested.target / $4 * $4 AND requested.target
+            )
+            WHERE message_metadata.message_id = $1
+            ORDER BY message_history.version
             """,
             message_id,
             old_version,
+            new_version,
+            versions.keyframe_interval,
         )
 
-        new_content = ""
-        if new_version == -1:
-            new_content = await self.bot.db.fetchval(
-                """
-                SELECT content FROM message_history
-                WHERE message_id = $1
-                ORDER BY version_at DESC
-                LIMIT 1
-                """,
-                message_id,
+        old_data = rows[0] if rows else None
+        contents = versions.decode_versions(rows)
+
+        old_content = new_content = None
+        if old_data:
+            version_count = old_data["version_count"]
+            old_content = contents.get(
+                versions.resolve_version(old_version, version_count)
             )
-        else:
-            new_content = await self.bot.db.fetchval(
-                """
-                SELECT content FROM message_history
-                WHERE message_id = $1
-                ORDER BY version_at
-                LIMIT 1 OFFSET $2
-                """,
-                message_id,
-                new_version,
+            new_content = contents.get(
+                versions.resolve_version(new_version, version_count)
             )
 
-        if not old_data or not new_content:
+        if old_content is None or new_content is None:
             await ctx.send(
                 embed=discord.Embed(
                     title="Message history",
@@ -141,73 +367,509 @@ class Logger(commands.Cog):
             return
 
         channel = self.bot.get_channel(old_data["channel_id"])
-        author = channel.guild.get_member(old_data["author_id"])
-        if not author:
-            author = await self.bot.fetch_user(old_data["author_id"])
+        author = await self.bot.user_resolver.resolve(
+            old_data["author_id"], guild=channel.guild
+        )
 
         embed = discord.Embed(
             title=f"Message {message_id}",
             url=f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}",
-            description=diff_message(old_data["content"], new_content),
-        )
-        embed.set_author(
-            name=f"{author} \N{BULLET} {author.id}",
-            url=f"https://discord.com/users/{author.id}",
-            icon_url=author.avatar_url,
+            description=await self.renderer.diff_message(old_content, new_content),
         )
+        if author:
+            embed.set_author(
+                name=f"{author} \N{BULLET} {author.id}",
+                url=f"https://discord.com/users/{author.id}",
+                icon_url=author.avatar_url,
+            )
 
         await ctx.send(embed=embed)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot or not message.guild:
+    @history.command(name="log")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def history_log(self, ctx: commands.Context, message_id: int):
+        """Shows every version of a message by its ID, each with what it changed"""
+
+        rows = await self.bot.db.fetch(
+            """
+            SELECT
+                message_history.version,
+                message_history.version_at,
+                message_history.content,
+                message_history.content_delta,
+                LAG(message_history.content) OVER (
+                    ORDER BY message_history.version
+                ) AS previous_content,
+                message_metadata.channel_id,
+                message_metadata.author_id
+            FROM message_metadata
+            JOIN message_history
+            ON message_history.message_id = message_metadata.message_id
+            WHERE message_metadata.message_id = $1
+            ORDER BY message_history.version
+            """,
+            message_id,
+        )
+
+        if not rows:
+            await ctx.send(
+                embed=discord.Embed(title="Message history", description="Not found")
+            )
+            return
+
+        # Delta encoded versions have no content for LAG to pick up, those are
+        # decoded here from the complete chain of versions
+        contents = versions.decode_versions(rows)
+
+        async def render_change(row):
+            previous = row["previous_content"]
+            if previous is None:
+                previous = contents.get(row["version"] - 1)
+
+            content = contents.get(row["version"])
+            if previous is None or content is None:
+                return "*Not found*"
+
+            diff = await self.renderer.diff_message(previous, content, max_len=1000)
+            return diff or "*No changes*"
+
+        first = "*Not found*"
+        if contents.get(0) is not None:
+            first = cut_words(escape(contents[0]), 1000) or "*Empty*"
+
+        diffs = [first] + await asyncio.gather(*map(render_change, rows[1:]))
+
+        channel = self.bot.get_channel(rows[0]["channel_id"])
+        author = await self.bot.user_resolver.resolve(
+            rows[0]["author_id"], guild=channel.guild
+        )
+
+        embed = discord.Embed(
+            title=f"Message {message_id}",
+            url=f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}",
+        )
+        embed.set_footer(
+            text="Page {current_page}/{total_pages}, "
+            "showing version {first_field}..{last_field}/{total_fields}"
+        )
+        if author:
+            embed.set_author(
+                name=f"{author} \N{BULLET} {author.id}",
+                url=f"https://discord.com/users/{author.id}",
+                icon_url=author.avatar_url,
+            )
+
+        paginator = paginators.FieldPaginator(
+            self.bot, base_embed=embed, fields_per_page=5
+        )
+        for row, diff in zip(rows, diffs):
+            paginator.add_field(
+                name=f"Version {row['version']} \N{BULLET} {row['version_at']:%Y-%m-%d %H:%M:%S}",
+                value=diff,
+                inline=False,
+            )
+
+        await paginator.send(target=ctx.channel, owner=ctx.author)
+
+    @history.command(name="recent")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def history_recent(
+        self,
+        ctx: commands.Context,
+        target: typing.Union[discord.TextChannel, converter.UserConverter],
+        duration: converter.TimeDurationConverter,
+    ):
+        """Lists the latest version of a user's or channel's messages, newest first
+
+        Duration takes a time window like 1d or 6h, counting back from now.
+        """
+
+        column = (
+            "channel_id" if isinstance(target, discord.TextChannel) else "author_id"
+        )
+        lowest, highest = snowflake_range(datetime.utcnow() - duration)
+
+        embed = discord.Embed(title=f"Recent messages of {target}")
+        embed.set_footer(
+            text="Page {current_page}, showing message {first_field}..{last_field}"
+        )
+
+        async def fetch_more():
+            nonlocal highest
+
+            rows = await self.bot.db.fetch(
+                f"""
+                SELECT message_id, channel_id, author_id, version_count
+                FROM message_metadata
+                WHERE {column} = $1
+                AND guild_id = $2
+                AND message_id BETWEEN $3 AND $4
+                ORDER BY message_id DESC
+                LIMIT $5
+                """,
+                target.id,
+                ctx.guild.id,
+                lowest,
+                highest,
+                paginator.fields_per_page,
+            )
+            if not rows:
+                return False
+
+            contents = await self.get_versions(
+                (row["message_id"], row["version_count"] - 1) for row in rows
+            )
+
+            for row in rows:
+                content = contents.get((row["message_id"], row["version_count"] - 1))
+                jump_url = f"https://discord.com/channels/{ctx.guild.id}/{row['channel_id']}/{row['message_id']}"
+                created_at = discord.utils.snowflake_time(row["message_id"])
+
+                paginator.add_field(
+                    name=f"{row['message_id']} \N{BULLET} {created_at:%Y-%m-%d %H:%M:%S}",
+                    value=f"<@{row['author_id']}> in <#{row['channel_id']}>"
+                    f" \N{BULLET} [jump]({jump_url})"
+                    f"\n{escape(cut_words(content or '', 200))}",
+                    inline=False,
+                )
+
+            highest = rows[-1]["message_id"] - 1
+            return len(rows) == paginator.fields_per_page
+
+        paginator = paginators.FieldPaginator(
+            self.bot, base_embed=embed, fields_per_page=5, fetch_more=fetch_more
+        )
+
+        if not await fetch_more():
+            paginator.fetch_more = None
+
+        if not paginator.pages[0]:
+            embed.description = "No messages found"
+            await ctx.send(embed=embed)
             return
 
+        await paginator.send(target=ctx.channel, owner=ctx.author)
+
+    @history.command(name="search")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def history_search(
+        self,
+        ctx: commands.Context,
+        query: str,
+        channel: typing.Optional[discord.TextChannel] = None,
+        user: typing.Optional[converter.UserConverter] = None,
+        since: typing.Optional[converter.TimeDurationConverter] = None,
+    ):
+        """Searches message history of this server, newest messages first
+
+        Every version of a message is searched, not only the latest one.
+        Use quotes for queries with more than one word, "-word" excludes a word.
+        Since takes a duration like 7d or 12h.
+        """
+
+        min_message_id = 0
+        if since:
+            min_message_id, _ = snowflake_range(datetime.utcnow() - since)
+
+        # Keyset of the last result shown, the next page starts right after it
+        last_key = (2 ** 63 - 1, 0)
+
+        embed = discord.Embed(title="Message history search")
+        embed.set_footer(
+            text="Page {current_page}, showing result {first_field}..{last_field}"
+        )
+
+        async def fetch_more():
+            nonlocal last_key
+
+            rows = await self.bot.db.fetch(
+                """
+                SELECT
+                    message_history.message_id,
+                    message_history.version,
+                    message_history.content,
+                    message_history.content_delta,
+                    message_metadata.channel_id,
+                    message_metadata.author_id
+                FROM message_history
+                JOIN message_metadata
+                ON message_metadata.message_id = message_history.message_id
+                WHERE message_history.content_tsv @@ websearch_to_tsquery('simple', $1)
+                AND message_metadata.guild_id = $2
+                AND ($3::BIGINT IS NULL OR message_metadata.channel_id = $3)
+                AND ($4::BIGINT IS NULL OR message_metadata.author_id = $4)
+                AND message_history.message_id >= $5
+                AND (message_history.message_id, message_history.version) < ($6, $7)
+                ORDER BY message_history.message_id DESC, message_history.version DESC
+                LIMIT $8
+                """,
+                query,
+                ctx.guild.id,
+                channel and channel.id,
+                user and user.id,
+                min_message_id,
+                *last_key,
+                paginator.fields_per_page,
+            )
+            if not rows:
+                return False
+
+            contents = await self.get_versions(
+                (row["message_id"], row["version"])
+                for row in rows
+                if row["content"] is None
+            )
+
+            for row in rows:
+                key = row["message_id"], row["version"]
+                content = (
+                    row["content"] if row["content"] is not None else contents.get(key)
+                )
+                jump_url = f"https://discord.com/channels/{ctx.guild.id}/{row['channel_id']}/{row['message_id']}"
+
+                paginator.add_field(
+                    name=f"{row['message_id']} \N{BULLET} version {row['version']}",
+                    value=f"<@{row['author_id']}> in <#{row['channel_id']}>"
+                    f" \N{BULLET} [jump]({jump_url})"
+                    f"\n{escape(cut_words(content or '', 200))}",
+                    inline=False,
+                )
+                last_key = key
+
+            return len(rows) == paginator.fields_per_page
+
+        paginator = paginators.FieldPaginator(
+            self.bot, base_embed=embed, fields_per_page=5, fetch_more=fetch_more
+        )
+
+        if not await fetch_more():
+            paginator.fetch_more = None
+
+        if not paginator.pages[0]:
+            embed.description = "No messages found"
+            await ctx.send(embed=embed)
+            return
+
+        await paginator.send(target=ctx.channel, owner=ctx.author)
+
+    @history.command(name="deleted")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def history_deleted(
+        self,
+        ctx: commands.Context,
+        channel: typing.Optional[discord.TextChannel] = None,
+    ):
+        """Shows the latest messages deleted in a channel, newest first
+
+        Defaults to the current channel. Only recent deletions are kept.
+        """
+
+        channel = channel or ctx.channel
+
+        embed = discord.Embed(title=f"Recently deleted in #{channel}")
+        entries = self.recent_deletions.get(channel.id)
+        if not entries:
+            embed.description = "No recent deletions"
+            await ctx.send(embed=embed)
+            return
+
+        embed.set_footer(
+            text="Page {current_page}/{total_pages}, "
+            "showing message {first_field}..{last_field}/{total_fields}"
+        )
+        paginator = paginators.FieldPaginator(
+            self.bot, base_embed=embed, fields_per_page=5
+        )
+
+        for message_id, author_id, deleted_at, content in entries:
+            paginator.add_field(
+                name=f"{message_id} \N{BULLET}"
+                f" {datetime.utcfromtimestamp(deleted_at):%Y-%m-%d %H:%M:%S}",
+                value=f"<@{author_id}>\n{cut_words(escape(content), 900)}",
+                inline=False,
+            )
+
+        await paginator.send(target=ctx.channel, owner=ctx.author)
+
+    @history.command(name="export")
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.max_concurrency(1, commands.BucketType.guild)
+    async def history_export(
+        self,
+        ctx: commands.Context,
+        target: typing.Union[discord.TextChannel, converter.UserConverter],
+    ):
+        """Exports every stored version of a user's or channel's messages
+
+        The export is a gzip compressed JSON lines file, one message version per line.
+        """
+
+        channel_id = target.id if isinstance(target, discord.TextChannel) else None
+        author_id = None if channel_id else target.id
+
+        with tempfile.TemporaryFile() as file:
+            with gzip.GzipFile(fileobj=file, mode="wb") as compressed:
+                row_count = await self.export_history(
+                    compressed, ctx.guild.id, channel_id=channel_id, author_id=author_id
+                )
+
+            if not row_count:
+                await ctx.send(
+                    embed=discord.Embed(
+                        title="Message history export", description="Not found"
+                    )
+                )
+                return
+
+            if file.tell() > ctx.guild.filesize_limit:
+                await ctx.send(
+                    embed=discord.Embed(
+                        title="Message history export",
+                        description=f"Export of {row_count} versions is too large to upload",
+                    )
+                )
+                return
+
+            file.seek(0)
+            await ctx.send(
+                f"Exported {row_count} versions",
+                file=discord.File(file, filename=f"history-{target.id}.jsonl.gz"),
+            )
+
+    async def export_history(
+        self,
+        file: typing.BinaryIO,
+        guild_id: int,
+        *,
+        channel_id: typing.Optional[int] = None,
+        author_id: typing.Optional[int] = None,
+    ):
+        """Streams matching message versions into file, returns the number written
+
+        Rows are read through a cursor in chunks of export_chunk_rows, so memory
+        use doesn't grow with the export. Writes happen in a thread, the
+        connection goes back to the pool as soon as the last chunk is read.
+        """
+
+        row_count = 0
+        # Only the version before the current row is needed to decode deltas
+        previous = None
+
         async with self.bot.db.acquire() as conn:
             async with conn.transaction():
-                await conn.execute(
+                cursor = await conn.cursor(
                     """
-                    INSERT INTO message_metadata (message_id, channel_id, guild_id, author_id)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT DO NOTHING
-                    """,
-                    message.id,
-                    message.channel.id,
-                    message.guild.id,
-                    message.author.id,
-                )
-                await conn.execute(
-                    """
-                    INSERT INTO message_history (message_id, version_at, content)
-                    VALUES ($1, $2, $3)
+                    SELECT
+                        message_metadata.message_id,
+                        message_metadata.channel_id,
+                        message_metadata.author_id,
+                        message_history.version,
+                        message_history.version_at,
+                        message_history.content,
+                        message_history.content_delta
+                    FROM message_metadata
+                    JOIN message_history
+                    ON message_history.message_id = message_metadata.message_id
+                    WHERE message_metadata.guild_id = $1
+                    AND ($2::BIGINT IS NULL OR message_metadata.channel_id = $2)
+                    AND ($3::BIGINT IS NULL OR message_metadata.author_id = $3)
+                    ORDER BY message_metadata.message_id, message_history.version
                     """,
-                    message.id,
-                    message.created_at,
-                    message.content,
+                    guild_id,
+                    channel_id,
+                    author_id,
                 )
 
+                while rows := await cursor.fetch(export_chunk_rows):
+                    lines = []
+
+                    for row in rows:
+                        content = row["content"]
+                        if row["content_delta"] is not None:
+                            content = None
+                            if previous and previous[:2] == (
+                                row["message_id"],
+                                row["version"] - 1,
+                            ):
+                                content = versions.decode_version(
+                                    previous[2], row["content_delta"]
+                                )
+
+                        previous = (row["message_id"], row["version"], content)
+                        lines.append(
+                            json.dumps(
+                                {
+                                    "message_id": row["message_id"],
+                                    "channel_id": row["channel_id"],
+                                    "author_id": row["author_id"],
+                                    "version": row["version"],
+                                    "version_at": row["version_at"].isoformat(),
+                                    "content": content,
+                                }
+                            )
+                            + "\n"
+                        )
+
+                    await self.bot.loop.run_in_executor(
+                        None, file.write, "".join(lines).encode()
+                    )
+                    row_count += len(rows)
+
+        return row_count
+
     @commands.Cog.listener()
-    async def on_raw_message_edit(self, event: discord.RawMessageUpdateEvent):
-        if (
-            event.data.get("webhook_id", None)
-            or not event.data.get("content", None)
-            or not event.data.get("guild_id", None)
-            or not event.data.get("edited_timestamp", None)
-        ):
+    async def on_config_update(
+        self, guild: discord.Guild, configurable: typing.Optional[config.Configurable]
+    ):
+        if configurable is None or configurable.name in exclusion_configurables:
+            self.exclusions.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.author.bot or not message.guild:
             return
 
-        old_content = await self.bot.db.fetchval(
-            """
-            SELECT content FROM message_history
-            WHERE message_id = $1
-            ORDER BY version_at DESC
-            LIMIT 1
-            """,
-            event.message_id,
+        guild_exclusions = await self.get_exclusions(message.guild)
+        if guild_exclusions and guild_exclusions.excludes(message):
+            self.bot.metrics["ingest"].incr("excluded")
+            return
+
+        self.record_activity(
+            "messages",
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            message.created_at,
         )
+        await self.ingest.put(message)
+
+        # Only cached once the row is buffered, an edit served from the cache
+        # before that would write its version ahead of the original. An edit
+        # while put was waiting has already cached the newer content.
+        if message.id not in self.message_cache:
+            self.message_cache.put(message.id, message.author.id, message.content)
+
+    @tasks.loop(seconds=0.5)
+    async def flush_messages(self):
+        await self.ingest.flush()
+
+    @flush_messages.before_loop
+    async def before_flush_messages(self):
+        await self.bot.wait_until_ready()
+
+    async def store_edit(self, event: discord.RawMessageUpdateEvent):
+        stored_data = await self.get_latest_version(event.message_id)
+        if not stored_data:
+            return None
 
+        _, old_content = stored_data
         if not old_content or old_content == event.data["content"]:
-            return
+            return None
+
+        # The new version is numbered from message_metadata, which the ingest
+        # buffer may not have written yet when the content came from the cache
+        if self.ingest.is_pending(event.message_id):
+            await self.ingest.flush()
 
         version_at = datetime.strptime(
             event.data["edited_timestamp"], "%Y-%m-%dT%H:%M:%S.%f%z"
@@ -215,39 +877,94 @@ class Logger(commands.Cog):
 
         async with self.bot.db.acquire() as conn:
             async with conn.transaction():
-                await conn.execute(
+                version_count = await conn.fetchval(
                     """
                     INSERT INTO message_metadata (message_id, channel_id, guild_id, author_id)
                     VALUES ($1, $2, $3, $4)
-                    ON CONFLICT DO NOTHING
+                    ON CONFLICT (message_id) DO UPDATE
+                    SET version_count = message_metadata.version_count + 1
+                    RETURNING version_count
                     """,
                     event.message_id,
                     event.channel_id,
                     int(event.data["guild_id"]),
                     int(event.data["author"]["id"]),
                 )
+                content, content_delta = versions.encode_version(
+                    old_content,
+                    event.data["content"],
+                    version_count - 1,
+                    delta=history_storage == "delta",
+                )
+
                 await conn.execute(
                     """
-                    INSERT INTO message_history (message_id, version_at, content)
-                    VALUES ($1, $2, $3)
+                    INSERT INTO message_history (
+                        message_id, version, version_at, content, content_delta, content_tsv
+                    )
+                    VALUES ($1, $2, $3, $4, $5, to_tsvector('simple', $6))
                     """,
                     event.message_id,
+                    version_count - 1,
                     version_at,
+                    content,
+                    content_delta,
                     event.data["content"],
                 )
 
+        self.message_cache.put(
+            event.message_id, int(event.data["author"]["id"]), event.data["content"]
+        )
+        self.record_activity(
+            "edits",
+            int(event.data["guild_id"]),
+            event.channel_id,
+            int(event.data["author"]["id"]),
+        )
+
+        return old_content
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, event: discord.RawMessageUpdateEvent):
+        if (
+            event.data.get("webhook_id", None)
+            or not event.data.get("content", None)
+            or not event.data.get("guild_id", None)
+            or not event.data.get("edited_timestamp", None)
+        ):
+            return
+
+        # Nothing of excluded messages is stored, skip the lookup of a version
+        role_ids = event.data.get("member", {}).get("roles", ())
+        if await self.is_excluded(event.channel_id, map(int, role_ids)):
+            return
+
+        # Deltas are encoded against the previous version, so edits of the
+        # same message must not interleave between reading and writing it
+        lock = self.edit_locks.setdefault(event.message_id, asyncio.Lock())
+        async with lock:
+            old_content = await self.store_edit(event)
+
+        if old_content is None:
+            return
+
         channel = self.bot.get_channel(event.channel_id)
         log_channel = await self.get_log_channel(channel.guild, "message")
         if log_channel:
-            author = channel.guild.get_member(int(event.data["author"]["id"]))
+            author = await self.bot.user_resolver.resolve(
+                int(event.data["author"]["id"]), guild=channel.guild
+            )
             if not author:
-                author = await self.bot.fetch_user(int(event.data["author"]["id"]))
+                return
+
+            diff = await self.renderer.diff_message(
+                old_content, event.data["content"], max_len=250
+            )
 
             jump_url = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{event.message_id}"
             embed = discord.Embed(
                 description=f"{author.mention} edited [`{event.message_id}`]({jump_url})"
-                f" in <#{event.channel_id}>"
-                f"\n{diff_message(old_content, event.data['content'], max_len=250)}"
+                f" in <#{event.channel_id}>\n{diff}"
             )
             embed.set_author(
                 name=f"{author} \N{BULLET} {author.id}",
@@ -255,35 +972,38 @@ class Logger(commands.Cog):
                 icon_url=author.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, event: discord.RawMessageDeleteEvent):
-        stored_data = await self.bot.db.fetchrow(
-            """
-            SELECT message_history.content, message_metadata.author_id FROM message_history
-            JOIN message_metadata ON (message_metadata.message_id = message_history.message_id)
-            WHERE message_history.message_id = $1
-            ORDER BY version_at DESC
-            LIMIT 1
-            """,
-            event.message_id,
-        )
+        if await self.is_excluded(event.channel_id):
+            return
+
+        stored_data = await self.get_latest_version(event.message_id)
+        self.message_cache.pop(event.message_id)
 
         if not stored_data:
             return
 
+        author_id, content = stored_data
+        self.record_activity("deletes", event.guild_id, event.channel_id, author_id)
+        self.recent_deletions.put(
+            event.channel_id, event.message_id, author_id, content
+        )
+
         channel = self.bot.get_channel(event.channel_id)
         log_channel = await self.get_log_channel(channel.guild, "message")
         if log_channel:
-            author = channel.guild.get_member(stored_data["author_id"])
+            author = await self.bot.user_resolver.resolve(
+                author_id, guild=channel.guild
+            )
             if not author:
-                author = await self.bot.fetch_user(stored_data["author_id"])
+                return
 
             embed = discord.Embed(
                 description=f"{author.mention} deleted `{event.message_id}`"
                 f" in <#{event.channel_id}>"
-                f"\n{cut_words(escape(stored_data['content']), max_len=250, end=' **... [cut off]**')}"
+                f"\n{cut_words(escape(content), max_len=250, end=' **... [cut off]**')}"
             )
             embed.set_author(
                 name=f"{author} \N{BULLET} {author.id}",
@@ -291,10 +1011,89 @@ class Logger(commands.Cog):
                 icon_url=author.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, event: discord.RawBulkMessageDeleteEvent
+    ):
+        if not event.guild_id or await self.is_excluded(event.channel_id):
+            return
+
+        stored_data = await self.get_latest_versions(event.message_ids)
+        for message_id in event.message_ids:
+            self.message_cache.pop(message_id)
+
+        for author_id, _ in stored_data.values():
+            self.record_activity("deletes", event.guild_id, event.channel_id, author_id)
+
+        if not stored_data:
+            return
+
+        guild = self.bot.get_guild(event.guild_id)
+        log_channel = await self.get_log_channel(guild, "message")
+        if not log_channel:
+            return
+
+        summary = (
+            f"**{len(event.message_ids)} messages were bulk deleted"
+            f" in <#{event.channel_id}>**"
+            f"\n{len(stored_data)} of them were stored"
+        )
+
+        lines = []
+        for message_id, (author_id, content) in sorted(stored_data.items()):
+            lines.append(
+                f"<@{author_id}> `{message_id}`:"
+                f" {cut_words(escape(content), max_len=250, end=' **... [cut off]**')}"
+            )
+
+        description = "\n".join([summary, *lines])
+        if len(description) <= 2048:
+            self.bot.log_dispatcher.send(
+                log_channel, discord.Embed(description=description)
+            )
+            return
+
+        transcript = []
+        for message_id, (author_id, content) in sorted(stored_data.items()):
+            author = guild.get_member(author_id) or author_id
+            created_at = discord.utils.snowflake_time(message_id)
+            transcript.append(
+                f"[{created_at:%Y-%m-%d %H:%M:%S}] {author} ({author_id})"
+                f" {message_id}:\n{content}\n"
+            )
+
+        await log_channel.send(
+            embed=discord.Embed(description=f"{summary}, see attached file"),
+            file=discord.File(
+                io.BytesIO("\n".join(transcript).encode()),
+                filename=f"deleted-messages-{event.channel_id}.txt",
+            ),
+        )
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.member_index.rebuild(self.bot.guilds)
+        self.bot.metrics["member_index"].set("users", len(self.member_index))
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        self.member_index.add_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.member_index.add_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.member_index.remove_guild(guild)
+        self.exclusions.pop(guild.id, None)
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
+        self.member_index.add(member.guild.id, member.id)
+
         await self.bot.db.execute(
             """
             INSERT INTO member_history (guild_id, member_id, version_at, tag, nick)
@@ -316,10 +1115,12 @@ class Logger(commands.Cog):
                 icon_url=member.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
+        self.member_index.remove(member.guild.id, member.id)
+
         await self.bot.db.execute(
             """
             INSERT INTO member_history (guild_id, member_id, version_at, tag, nick)
@@ -329,12 +1130,10 @@ class Logger(commands.Cog):
             member.id,
         )
 
-        async for log in member.guild.audit_logs(action=discord.AuditLogAction.kick):
-            if log.created_at < member.joined_at:
-                break
-            if log.target.id != member.id:
-                continue
-
+        log = await self.audit_logs.find(
+            member.guild, discord.AuditLogAction.kick, member.id, after=member.joined_at
+        )
+        if log:
             moderator = log.user
             reason = log.reason
 
@@ -368,9 +1167,7 @@ class Logger(commands.Cog):
                     icon_url=member.avatar_url,
                 )
 
-                await log_channel.send(embed=embed)
-
-            break
+                self.bot.log_dispatcher.send(log_channel, embed)
 
         log_channel = await self.get_log_channel(member.guild, "member")
         if log_channel:
@@ -381,7 +1178,7 @@ class Logger(commands.Cog):
                 icon_url=member.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
@@ -413,7 +1210,7 @@ class Logger(commands.Cog):
                 icon_url=after.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
     @commands.Cog.listener()
     async def on_user_update(self, before, after):
@@ -421,13 +1218,17 @@ class Logger(commands.Cog):
             return
 
         args = []
-        for guild in self.bot.guilds:
-            member = guild.get_member(after.id)
+        for guild_id in self.member_index.guilds_for(after.id):
+            guild = self.bot.get_guild(guild_id)
+            member = guild and guild.get_member(after.id)
             if not member:
                 continue
 
             args.append((guild.id, after.id, str(after), member.nick))
 
+        if not args:
+            return
+
         await self.bot.db.executemany(
             """
             INSERT INTO member_history (guild_id, member_id, version_at, tag, nick)
@@ -444,12 +1245,10 @@ class Logger(commands.Cog):
             else datetime.utcnow() - timedelta(minutes=5)
         )
 
-        async for log in guild.audit_logs(action=discord.AuditLogAction.ban):
-            if log.created_at < max_created_at:
-                break
-            if log.target.id != user.id:
-                continue
-
+        log = await self.audit_logs.find(
+            guild, discord.AuditLogAction.ban, user.id, after=max_created_at
+        )
+        if log:
             moderator = log.user
             reason = log.reason
 
@@ -483,18 +1282,17 @@ class Logger(commands.Cog):
                     icon_url=user.avatar_url,
                 )
 
-                await log_channel.send(embed=embed)
-
-            break
+                self.bot.log_dispatcher.send(log_channel, embed)
 
     @commands.Cog.listener()
     async def on_member_unban(self, guild, user):
-        async for log in guild.audit_logs(action=discord.AuditLogAction.unban):
-            if log.created_at < datetime.utcnow() - timedelta(minutes=5):
-                break
-            if log.target.id != user.id:
-                continue
-
+        log = await self.audit_logs.find(
+            guild,
+            discord.AuditLogAction.unban,
+            user.id,
+            after=datetime.utcnow() - timedelta(minutes=5),
+        )
+        if log:
             moderator = log.user
             reason = log.reason
 
@@ -528,9 +1326,7 @@ class Logger(commands.Cog):
                     icon_url=user.avatar_url,
                 )
 
-                await log_channel.send(embed=embed)
-
-            break
+                self.bot.log_dispatcher.send(log_channel, embed)
 
 
 def setup(bot: commands.Bot):
@@ -7,7 +7,22 @@ import discord
 from bot.ext import config
 from bot.utils import paginators, wrap_in_code
 from discord.ext import commands
-from discord.utils import get
+
+
+def format_value(value_type, value):
+    if value is None:
+        return "*disabled*"
+    elif isinstance(value, bool):
+        return "`yes`" if value else "`no`"
+    elif typing.get_origin(value_type) is list:
+        (item_type,) = typing.get_args(value_type)
+        return ", ".join(format_value(item_type, item) for item in value)
+    elif value_type in (discord.TextChannel, discord.CategoryChannel):
+        return f"<#{value}>"
+    elif value_type is discord.Role:
+        return f"<@&{value}>"
+    else:
+        return wrap_in_code(str(value))
 
 
 class Meta(commands.Cog):
@@ -32,7 +47,7 @@ class Meta(commands.Cog):
         command = f"{ctx.prefix}{self.config.qualified_name}"
 
         if option:
-            configurable = get(config.configurables, name=option.lower())
+            configurable = config.configurables_by_name.get(option.lower())
             if configurable is None:
                 raise commands.UserInputError(
                     f"Option {wrap_in_code(option)} not found"
@@ -60,16 +75,7 @@ class Meta(commands.Cog):
                 if new_value is not None
                 else await self.bot.get_cog("Config").get_value(ctx.guild, configurable)
             )
-            if value is None:
-                value = "*disabled*"
-            elif isinstance(value, bool):
-                value = "`yes`" if value else "`no`"
-            elif configurable.type is discord.TextChannel:
-                value = f"<#{value}>"
-            elif configurable.type is discord.Role:
-                value = f"<@&{value}>"
-            else:
-                value = wrap_in_code(str(value))
+            value = format_value(configurable.type, value)
 
             set_configurable_signature = wrap_in_code(
                 f"{command} {configurable.name} <new value>"
@@ -118,6 +124,27 @@ class Meta(commands.Cog):
 
         await paginator.send(target=ctx.channel, owner=ctx.author)
 
+    @commands.command()
+    @commands.is_owner()
+    async def metrics(self, ctx: commands.Context):
+        """Shows internal counters and timings"""
+
+        embed = discord.Embed(title="Metrics")
+        embed.set_footer(
+            text="Page {current_page}/{total_pages}, "
+            "showing component {first_field}..{last_field}/{total_fields}"
+        )
+        paginator = paginators.FieldPaginator(self.bot, base_embed=embed)
+
+        for name, component in sorted(self.bot.metrics.items()):
+            paginator.add_field(
+                name=name,
+                value=wrap_in_code(component.summary() or "empty", block=True),
+                inline=False,
+            )
+
+        await paginator.send(target=ctx.channel, owner=ctx.author)
+
     @commands.command()
     @commands.cooldown(3, 8, commands.BucketType.channel)
     async def about(self, ctx: commands.Context):
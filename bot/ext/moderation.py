@@ -122,7 +122,7 @@ class Moderation(commands.Cog):
                 icon_url=member.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
         await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
@@ -181,7 +181,7 @@ class Moderation(commands.Cog):
                 icon_url=member.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
         await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
@@ -229,7 +229,7 @@ class Moderation(commands.Cog):
                 icon_url=member.avatar_url,
             )
 
-            await log_channel.send(embed=embed)
+            self.bot.log_dispatcher.send(log_channel, embed)
 
         await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
@@ -258,9 +258,10 @@ class Moderation(commands.Cog):
             if not guild:
                 continue
 
-            member = guild.get_member(row["target_id"]) or await self.bot.fetch_user(
-                row["target_id"]
-            )
+            member = await self.bot.user_resolver.resolve(row["target_id"], guild=guild)
+            if not member:
+                continue
+
             duration = timedelta(seconds=row["duration"])
 
             try:
@@ -298,7 +299,7 @@ class Moderation(commands.Cog):
                     icon_url=member.avatar_url,
                 )
 
-            await log_channel.send(embed=embed)
+                self.bot.log_dispatcher.send(log_channel, embed)
 
     @auto_unsilence.before_loop
     async def before_auto_unsilence(self):
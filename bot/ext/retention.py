@@ -0,0 +1,179 @@
+import sys
+import traceback
+from datetime import datetime, timedelta
+from os import environ
+
+import discord
+from discord.ext import commands, tasks
+
+partitioned_tables = ("message_history", "message_metadata")
+
+# Used for guilds without a retention configured, unset keeps messages forever
+default_retention_days = environ.get("MESSAGE_RETENTION_DAYS")
+
+prune_batch_size = 5000
+
+# Upper bound of batches deleted per guild in one run, so a guild that is far
+# behind catches up over a few runs without stalling the others
+prune_max_batches = 100
+
+
+def month_start(when: datetime, offset: int = 0):
+    month = when.year * 12 + when.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+class Retention(commands.Cog):
+    """Message history partition and retention management"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.metrics = bot.metrics["retention"]
+        self.maintain_partitions.start()
+        super().__init__()
+
+    def cog_unload(self):
+        self.maintain_partitions.cancel()
+        return super().cog_unload()
+
+    async def create_partitions(self, months_ahead: int = 3):
+        now = datetime.utcnow()
+
+        for offset in range(months_ahead + 1):
+            start = month_start(now, offset)
+            end = month_start(now, offset + 1)
+
+            # Referenced table first so the foreign key can attach
+            for table in reversed(partitioned_tables):
+                await self.bot.db.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {table}_{start:%Y%m}
+                    PARTITION OF {table}
+                    FOR VALUES FROM ({discord.utils.time_snowflake(start)})
+                    TO ({discord.utils.time_snowflake(end)})
+                    """
+                )
+
+    async def drop_partitions(self, cutoff: datetime):
+        partitions = await self.bot.db.fetch(
+            """
+            SELECT parent.relname AS parent_name, child.relname AS partition_name
+            FROM pg_inherits
+            JOIN pg_class parent ON (parent.oid = pg_inherits.inhparent)
+            JOIN pg_class child ON (child.oid = pg_inherits.inhrelid)
+            WHERE parent.relname = ANY($1::TEXT[])
+            """,
+            partitioned_tables,
+        )
+
+        # History partitions reference metadata ones, so they have to go first
+        partitions = sorted(
+            partitions,
+            key=lambda row: partitioned_tables.index(row["parent_name"]),
+        )
+
+        for partition in partitions:
+            suffix = partition["partition_name"][len(partition["parent_name"]) + 1 :]
+            try:
+                start = datetime.strptime(suffix, "%Y%m")
+            except ValueError:
+                continue
+
+            if month_start(start, 1) > cutoff:
+                continue
+
+            await self.bot.db.execute(f"DROP TABLE {partition['partition_name']}")
+            self.metrics.incr("partitions_dropped")
+
+    async def prune_guild(self, guild_id: int, cutoff: datetime):
+        for _ in range(prune_max_batches):
+            if await self.prune_batch(guild_id, cutoff) < prune_batch_size:
+                break
+
+    async def prune_batch(self, guild_id: int, cutoff: datetime):
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                message_ids = await conn.fetch(
+                    """
+                    SELECT message_id FROM message_metadata
+                    WHERE guild_id = $1 AND message_id < $2
+                    LIMIT $3
+                    """,
+                    guild_id,
+                    discord.utils.time_snowflake(cutoff),
+                    prune_batch_size,
+                )
+                message_ids = [row["message_id"] for row in message_ids]
+
+                await conn.execute(
+                    """
+                    DELETE FROM message_history
+                    WHERE message_id = ANY($1::BIGINT[])
+                    """,
+                    message_ids,
+                )
+                await conn.execute(
+                    """
+                    DELETE FROM message_metadata
+                    WHERE message_id = ANY($1::BIGINT[])
+                    """,
+                    message_ids,
+                )
+
+        self.metrics.incr("messages_pruned", len(message_ids))
+        return len(message_ids)
+
+    @tasks.loop(hours=1)
+    async def maintain_partitions(self):
+        # Errors are logged per step, an exception escaping would stop the loop
+        try:
+            await self.create_partitions()
+        except Exception:
+            self.metrics.incr("errors")
+            traceback.print_exc(file=sys.stderr)
+
+        try:
+            retentions = await self.bot.db.fetch(
+                """
+                SELECT guild_id, COALESCE(message_retention_days, $1) AS retention_days
+                FROM guild_config
+                """,
+                int(default_retention_days) if default_retention_days else None,
+            )
+        except Exception:
+            self.metrics.incr("errors")
+            traceback.print_exc(file=sys.stderr)
+            return
+
+        now = datetime.utcnow()
+
+        # Values below a day would delete messages as they are written, they
+        # are treated like no retention so nothing is pruned or dropped for them
+        retention_days = [
+            days if days is not None and days >= 1 else None
+            for days in (row["retention_days"] for row in retentions)
+        ]
+
+        for row, days in zip(retentions, retention_days):
+            if days is not None:
+                try:
+                    await self.prune_guild(row["guild_id"], now - timedelta(days=days))
+                except Exception:
+                    self.metrics.incr("errors")
+                    traceback.print_exc(file=sys.stderr)
+
+        if retention_days and None not in retention_days:
+            longest = max(retention_days)
+            try:
+                await self.drop_partitions(now - timedelta(days=longest))
+            except Exception:
+                self.metrics.incr("errors")
+                traceback.print_exc(file=sys.stderr)
+
+    @maintain_partitions.before_loop
+    async def before_maintain_partitions(self):
+        await self.bot.wait_until_ready()
+
+
+def setup(bot: commands.Bot):
+    bot.add_cog(Retention(bot))
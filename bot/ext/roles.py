@@ -2,9 +2,7 @@ import re
 from datetime import datetime, timedelta
 
 import discord
-from bot.ext import config
 from discord.ext import commands, tasks
-from discord.utils import get
 
 
 class Roles(commands.Cog):
@@ -21,9 +19,7 @@ class Roles(commands.Cog):
 
     async def get_role(self, guild: discord.Guild, role_type: str):
         cfg = self.bot.get_cog("Config")
-        configurable = get(config.configurables, name=f"{role_type}-role")
-        role_id = await cfg.get_value(guild, configurable)
-        return get(guild.roles, id=role_id)
+        return await cfg.get_resolved(guild, f"{role_type}-role")
 
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, member: discord.Member):
@@ -0,0 +1,215 @@
+import collections
+import itertools
+import sys
+import traceback
+import typing
+from datetime import datetime, timedelta
+
+import discord
+from bot.utils import converter, paginators
+from discord.ext import commands, tasks
+
+activity_kinds = ("messages", "edits", "deletes")
+
+# Upper bound of rollup rows written per statement
+max_flush_rows = 5000
+
+
+class Stats(commands.Cog):
+    """Message activity statistics"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.metrics = bot.metrics["stats"]
+        # (guild_id, day, channel_id, author_id) -> [messages, edits, deletes]
+        self.pending = collections.defaultdict(lambda: [0, 0, 0])
+        self.flush_activity.start()
+        super().__init__()
+
+    def cog_unload(self):
+        self.flush_activity.cancel()
+        return super().cog_unload()
+
+    def record(
+        self,
+        kind: str,
+        guild_id: int,
+        channel_id: int,
+        author_id: int,
+        when: typing.Optional[datetime] = None,
+    ):
+        day = (when or datetime.utcnow()).date()
+        self.pending[guild_id, day, channel_id, author_id][
+            activity_kinds.index(kind)
+        ] += 1
+
+    async def flush(self):
+        # Everything pending when called is written, in chunks; rows added in
+        # the meantime wait for the next flush so this always ends
+        chunks = -(-len(self.pending) // max_flush_rows)
+        for _ in range(chunks):
+            await self.flush_chunk()
+
+    async def flush_chunk(self):
+        keys = list(itertools.islice(self.pending, max_flush_rows))
+        if not keys:
+            return
+
+        rows = [key + tuple(self.pending.pop(key)) for key in keys]
+        self.metrics.set("pending_rows", len(self.pending))
+
+        try:
+            with self.metrics.time("flush"):
+                await self.bot.db.execute(
+                    """
+                    INSERT INTO message_activity_daily AS activity
+                    (guild_id, day, channel_id, author_id, messages, edits, deletes)
+                    SELECT * FROM unnest(
+                        $1::BIGINT[], $2::DATE[], $3::BIGINT[], $4::BIGINT[],
+                        $5::INT[], $6::INT[], $7::INT[]
+                    )
+                    ON CONFLICT (guild_id, day, channel_id, author_id) DO UPDATE SET
+                        messages = activity.messages + EXCLUDED.messages,
+                        edits = activity.edits + EXCLUDED.edits,
+                        deletes = activity.deletes + EXCLUDED.deletes
+                    """,
+                    *zip(*rows),
+                )
+        except Exception:
+            self.metrics.incr("rows_dropped", len(rows))
+            traceback.print_exc(file=sys.stderr)
+        else:
+            self.metrics.incr("rows_written", len(rows))
+
+    @tasks.loop(seconds=30)
+    async def flush_activity(self):
+        await self.flush()
+
+    @flush_activity.before_loop
+    async def before_flush_activity(self):
+        await self.bot.wait_until_ready()
+
+    async def send_activity(
+        self,
+        ctx: commands.Context,
+        title: str,
+        group_by: str,
+        days: int,
+        *,
+        channel_id: typing.Optional[int] = None,
+        author_id: typing.Optional[int] = None,
+        mention: typing.Callable[[typing.Any], str] = str,
+    ):
+        days = max(days, 1)
+        await self.flush()
+
+        rows = await self.bot.db.fetch(
+            f"""
+            SELECT
+                {group_by} AS key,
+                SUM(messages) AS messages,
+                SUM(edits) AS edits,
+                SUM(deletes) AS deletes
+            FROM message_activity_daily
+            WHERE guild_id = $1
+            AND day >= $2
+            AND ($3::BIGINT IS NULL OR channel_id = $3)
+            AND ($4::BIGINT IS NULL OR author_id = $4)
+            GROUP BY {group_by}
+            ORDER BY {"key DESC" if group_by == "day" else "messages DESC"}
+            """,
+            ctx.guild.id,
+            datetime.utcnow().date() - timedelta(days=days - 1),
+            channel_id,
+            author_id,
+        )
+
+        embed = discord.Embed(title=title)
+        if not rows:
+            embed.description = "No activity recorded"
+            await ctx.send(embed=embed)
+            return
+
+        embed.description = (
+            f"Last {days} days: {sum(row['messages'] for row in rows)} messages,"
+            f" {sum(row['edits'] for row in rows)} edits,"
+            f" {sum(row['deletes'] for row in rows)} deletes"
+        )
+        embed.set_footer(
+            text="Page {current_page}/{total_pages}, "
+            "showing {first_field}..{last_field}/{total_fields}"
+        )
+        paginator = paginators.FieldPaginator(
+            self.bot, base_embed=embed, fields_per_page=12
+        )
+
+        for row in rows:
+            paginator.add_field(
+                name=str(row["key"]),
+                value=f"{mention(row['key'])}\n{row['messages']} messages"
+                f"\n{row['edits']} edits\n{row['deletes']} deletes",
+            )
+
+        await paginator.send(target=ctx.channel, owner=ctx.author)
+
+    @commands.group(invoke_without_command=True)
+    @commands.has_guild_permissions(manage_messages=True)
+    async def stats(self, ctx: commands.Context, days: int = 30):
+        """Shows message activity of this server per channel"""
+
+        await self.send_activity(
+            ctx,
+            "Server activity",
+            "channel_id",
+            days,
+            mention=lambda channel_id: f"<#{channel_id}>",
+        )
+
+    @stats.command(name="users")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def stats_users(self, ctx: commands.Context, days: int = 30):
+        """Shows message activity of this server per user"""
+
+        await self.send_activity(
+            ctx,
+            "User activity",
+            "author_id",
+            days,
+            mention=lambda author_id: f"<@{author_id}>",
+        )
+
+    @stats.command(name="channel")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def stats_channel(
+        self, ctx: commands.Context, channel: discord.TextChannel, days: int = 30
+    ):
+        """Shows message activity of a channel per day"""
+
+        await self.send_activity(
+            ctx,
+            f"Activity in #{channel}",
+            "day",
+            days,
+            channel_id=channel.id,
+            mention=lambda day: f"{day:%A}",
+        )
+
+    @stats.command(name="user")
+    @commands.has_guild_permissions(manage_messages=True)
+    async def stats_user(
+        self, ctx: commands.Context, user: converter.UserConverter, days: int = 30
+    ):
+        """Shows message activity of a user per day"""
+
+        await self.send_activity(
+            ctx,
+            f"Activity of {user}",
+            "day",
+            days,
+            author_id=user.id,
+            mention=lambda day: f"{day:%A}",
+        )
+
+
+def setup(bot: commands.Bot):
+    bot.add_cog(Stats(bot))
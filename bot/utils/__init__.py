@@ -1,8 +1,10 @@
 import difflib
 import re
+from datetime import datetime
 from typing import Optional, Union
 
-from discord.utils import escape_markdown
+from bot.utils import diff
+from discord.utils import escape_markdown, time_snowflake
 
 
 def wrap_in_code(value: str, *, block: Optional[Union[bool, str]] = None):
@@ -14,7 +16,19 @@ def wrap_in_code(value: str, *, block: Optional[Union[bool, str]] = None):
 
     lang = "" if block is True else block
 
-    return f"```{block}\n" + value + "\n```"
+    return f"```{lang}\n" + value + "\n```"
+
+
+def snowflake_range(start: datetime, end: Optional[datetime] = None):
+    """Returns the lowest and highest snowflake that could be created in a time window
+
+    Both bounds are inclusive, end defaults to now.
+    """
+
+    return (
+        time_snowflake(start),
+        time_snowflake(end or datetime.utcnow(), high=True),
+    )
 
 
 def escape(text: str):
@@ -22,20 +36,34 @@ def escape(text: str):
 
 
 def cut_words(text: str, max_len: int, *, end: str = "..."):
-    words = [""] + re.split(r"(\s+)", text)
+    if len(text) + len(end) <= max_len:
+        return text
 
-    result = ""
+    # Only the first word that crosses max_len matters, later text can't affect
+    # where the cut is made
+    words = [""] + re.split(r"(\s+)", text[: max_len + 1])
 
     if len(words[1] + end) > max_len:
         return words[1][: max_len - len(end)] + end
 
-    for last_sep, word in zip(words[::2], words[1::2]):
-        if len(result + last_sep + word + end) > max_len:
-            return result + end
+    length = len(end)
+    for index in range(1, len(words), 2):
+        length += len(words[index - 1]) + len(words[index])
+        if length > max_len:
+            return "".join(words[: index - 1]) + end
 
-        result += last_sep + word
+    return text
 
-    return result
+
+# Edits with at most this many words (old and new combined) are diffed with
+# difflib, larger ones with the bounded Myers diff that can't stall on them
+difflib_max_words = 400
+
+# When only max_len characters are shown, large edits needing more than this
+# many word insertions and deletions are diffed over a window of words past
+# their first change instead, doubled until the shown groups fit inside it
+diff_window_edits = 32
+diff_window = 64
 
 
 def diff_message(
@@ -45,22 +73,109 @@ def diff_message(
     max_len: Optional[int] = None,
     group_sep: str = "**...**",
     cutoff_end: str = " **... [cut off]**",
+    max_edits: int = 200,
 ):
     a_words = a.split()
     b_words = b.split()
 
-    matcher = difflib.SequenceMatcher(autojunk=False)
-    matcher.set_seqs(a_words, b_words)
+    if len(a_words) + len(b_words) <= difflib_max_words:
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seqs(a_words, b_words)
+        return format_diff(
+            a_words,
+            b_words,
+            matcher.get_grouped_opcodes(),
+            max_len=max_len,
+            group_sep=group_sep,
+            cutoff_end=cutoff_end,
+        )
+
+    # Most edits touch a few words, diffing the whole message is exact and
+    # cheap for those
+    blocks = diff.matching_blocks(
+        a_words,
+        b_words,
+        max_edits=diff_window_edits if max_len else max_edits,
+        replace_overflow=not max_len,
+    )
+    if blocks is not None:
+        return format_diff(
+            a_words,
+            b_words,
+            diff.grouped_opcodes(diff.opcodes(blocks)),
+            max_len=max_len,
+            group_sep=group_sep,
+            cutoff_end=cutoff_end,
+        )
+
+    prefix = 0
+    while (
+        prefix < len(a_words)
+        and prefix < len(b_words)
+        and a_words[prefix] == b_words[prefix]
+    ):
+        prefix += 1
+
+    # max_edits bounds the work per window, not the whole edit, so changes
+    # spread over a long message are still shown word by word
+    window = diff_window
+    while True:
+        a_window = a_words[: prefix + window]
+        b_window = b_words[: prefix + window]
+        complete = len(a_window) == len(a_words) and len(b_window) == len(b_words)
+
+        blocks = diff.matching_blocks(a_window, b_window, max_edits=max_edits)
+        res = format_diff(
+            a_words,
+            b_words,
+            diff.grouped_opcodes(diff.opcodes(blocks)),
+            max_len=max_len,
+            group_sep=group_sep,
+            cutoff_end=cutoff_end,
+            horizon=None if complete else (len(a_window), len(b_window)),
+        )
+        if res is not None:
+            return res
+
+        window *= 2
+
+
+def format_diff(
+    a_words: list,
+    b_words: list,
+    grouped_opcodes,
+    *,
+    max_len: Optional[int],
+    group_sep: str,
+    cutoff_end: str,
+    horizon: Optional[tuple] = None,
+):
+    """Formats grouped opcodes of two word lists for diff_message
 
-    groups = []
+    With a horizon, the opcodes only cover the words before it and None is
+    returned if a group reaches it before max_len is filled.
+    """
 
     start = f"{group_sep} "
     end = f" {group_sep}"
 
-    for group in matcher.get_grouped_opcodes():
+    groups = []
+    length = 0
+
+    for group in grouped_opcodes:
         parts = []
 
         for op, i1, i2, j1, j2 in group:
+            # Past the horizon the alignment may change once more words are
+            # seen, so it's only fine to stop here if max_len is already filled
+            if horizon and (i2 >= horizon[0] or j2 >= horizon[1]):
+                shown = start + f" {group_sep} ".join(
+                    groups + [" ".join(parts)] if parts else groups
+                )
+                if max_len and len(shown) > max_len:
+                    return cut_words(shown, max_len, end=cutoff_end)
+                return None
+
             if min(i1, j1) == 0:
                 start = ""
             if i2 == len(a_words) or j2 == len(b_words):
@@ -74,6 +189,16 @@ def diff_message(
                 parts.append(escape(" ".join(a_words[i1:i2])))
 
         groups.append(" ".join(parts))
+        length += len(groups[-1]) + len(group_sep) + 2
+
+        # Anything past the budget would be cut off anyway
+        if max_len and len(start) + length > max_len + len(group_sep) + 2:
+            return cut_words(
+                start + f" {group_sep} ".join(groups), max_len, end=cutoff_end
+            )
+
+    if horizon:
+        return None
 
     res = start + f" {group_sep} ".join(groups) + end
     if max_len:
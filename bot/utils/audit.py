@@ -0,0 +1,96 @@
+import asyncio
+import collections
+from datetime import datetime
+
+import discord
+import lru
+from discord.ext import commands
+
+
+class AuditLogCache:
+    """Recent audit log entries per guild, shared between event handlers
+
+    Lookups are answered from entries fetched earlier when possible, otherwise
+    only entries newer than the last one seen are fetched. Concurrent lookups
+    for the same guild wait on a single request.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        *,
+        max_guilds: int = 1024,
+        max_entries: int = 200,
+    ):
+        self.bot = bot
+        self.max_entries = max_entries
+        self.metrics = bot.metrics["audit_logs"]
+
+        self.entries = lru.LRU(max_guilds)
+        self.fetches = {}
+
+    async def find(
+        self,
+        guild: discord.Guild,
+        action: discord.AuditLogAction,
+        target_id: int,
+        *,
+        after: datetime,
+    ):
+        entry = self.match(guild, action, target_id, after)
+        if entry:
+            self.metrics.incr("hits")
+            return entry
+
+        self.metrics.incr("misses")
+        await self.refresh(guild)
+        return self.match(guild, action, target_id, after)
+
+    def match(
+        self,
+        guild: discord.Guild,
+        action: discord.AuditLogAction,
+        target_id: int,
+        after: datetime,
+    ):
+        for entry in reversed(self.entries.get(guild.id, ())):
+            if entry.created_at < after:
+                break
+            if entry.action == action and entry.target.id == target_id:
+                return entry
+
+        return None
+
+    async def refresh(self, guild: discord.Guild):
+        fetch = self.fetches.get(guild.id)
+        if fetch is None:
+            fetch = self.bot.loop.create_task(self.fetch(guild))
+            fetch.add_done_callback(lambda _: self.fetches.pop(guild.id, None))
+            self.fetches[guild.id] = fetch
+        else:
+            self.metrics.incr("coalesced")
+
+        await asyncio.shield(fetch)
+
+    async def fetch(self, guild: discord.Guild):
+        entries = self.entries.get(guild.id)
+
+        if entries is None:
+            entries = collections.deque(maxlen=self.max_entries)
+        newest_id = entries[-1].id if entries else 0
+        # A single page is enough to start with, later refreshes may need more
+        # to catch up with everything since the last one
+        limit = self.max_entries if newest_id else 100
+
+        # Pages are requested newest first and iteration stops at the newest
+        # entry already cached, so a refresh usually costs a single request.
+        # discord.py 1.6 ignores `after` here and would page from the oldest.
+        new_entries = []
+        with self.metrics.time("fetch"):
+            async for entry in guild.audit_logs(limit=limit):
+                if entry.id <= newest_id:
+                    break
+                new_entries.append(entry)
+
+        entries.extend(reversed(new_entries))
+        self.entries[guild.id] = entries
@@ -0,0 +1,89 @@
+import heapq
+import sys
+
+from bot.utils import metrics
+
+
+class MessageCache:
+    """Bounded cache of the latest author and content of recent messages
+
+    Memory use is accounted per entry from the size of its content, once the
+    budget is exceeded the entries with the lowest (oldest) snowflakes are
+    evicted first, regardless of when they were last touched.
+    """
+
+    entry_overhead = 200
+
+    def __init__(
+        self,
+        metrics: metrics.Metrics,
+        *,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.metrics = metrics
+        self.max_bytes = max_bytes
+
+        self.entries = {}
+        self.heap = []
+        self.size = 0
+
+    def __contains__(self, message_id: int):
+        return message_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry_size(self, content: str):
+        return self.entry_overhead + sys.getsizeof(content)
+
+    def get(self, message_id: int):
+        entry = self.entries.get(message_id)
+
+        self.metrics.incr("hits" if entry else "misses")
+        hits = self.metrics.counters["hits"]
+        self.metrics.set(
+            "hit_rate", f"{hits / (hits + self.metrics.counters['misses']):.2%}"
+        )
+
+        return entry
+
+    def put(self, message_id: int, author_id: int, content: str):
+        previous = self.entries.get(message_id)
+        if previous:
+            self.size -= self.entry_size(previous[1])
+        else:
+            heapq.heappush(self.heap, message_id)
+
+        self.entries[message_id] = (author_id, content)
+        self.size += self.entry_size(content)
+
+        while self.size > self.max_bytes and self.heap:
+            oldest = heapq.heappop(self.heap)
+            if oldest in self.entries:
+                self.metrics.incr("evictions")
+                self.remove(oldest)
+
+        self.update_gauges()
+
+    def pop(self, message_id: int):
+        entry = self.entries.get(message_id)
+        if entry:
+            self.remove(message_id)
+
+            # Deleted ids stay in the heap until evicted, rebuild it before
+            # those stale ids outnumber the live ones
+            if len(self.heap) > 2 * len(self.entries) + 1024:
+                self.heap = list(self.entries)
+                heapq.heapify(self.heap)
+
+            self.update_gauges()
+
+        return entry
+
+    def remove(self, message_id: int):
+        _, content = self.entries.pop(message_id)
+        self.size -= self.entry_size(content)
+
+    def update_gauges(self):
+        self.metrics.set("entries", len(self.entries))
+        self.metrics.set("resident_bytes", self.size)
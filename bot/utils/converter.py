@@ -26,7 +26,7 @@ class UserConverter(commands.UserConverter):
         except commands.UserNotFound:
             if match := self._get_id_match(argument):
                 user_id = int(match.group(1))
-                user = await ctx.bot.fetch_user(user_id)
+                user = await ctx.bot.user_resolver.resolve(user_id, guild=ctx.guild)
                 if user:
                     return user
 
@@ -0,0 +1,65 @@
+import collections
+import time
+import typing
+
+from bot.utils import metrics
+
+
+class DeletionBuffer:
+    """Ring buffer of the most recently deleted messages per channel
+
+    Every channel keeps at most `per_channel` entries of (message_id, author_id,
+    deleted_at, content), content cut to `max_content` characters. Channels
+    without a deletion for `idle_after` seconds are dropped, beyond
+    `max_channels` the ones with the oldest last deletion are dropped first.
+    """
+
+    def __init__(
+        self,
+        metrics: metrics.Metrics,
+        *,
+        max_channels: int = 1024,
+        per_channel: int = 25,
+        max_content: int = 500,
+        idle_after: float = 3600.0,
+    ):
+        self.metrics = metrics
+        self.max_channels = max_channels
+        self.per_channel = per_channel
+        self.max_content = max_content
+        self.idle_after = idle_after
+
+        # Ordered by last deletion, so idle channels are always at the front
+        self.channels = {}
+
+    def put(self, channel_id: int, message_id: int, author_id: int, content: str):
+        now = time.time()
+
+        _, entries = self.channels.pop(
+            channel_id, (None, collections.deque(maxlen=self.per_channel))
+        )
+        entries.append((message_id, author_id, int(now), content[: self.max_content]))
+        self.channels[channel_id] = (now, entries)
+
+        self.sweep(now)
+
+    def get(self, channel_id: int) -> typing.List[typing.Tuple[int, int, int, str]]:
+        self.sweep(time.time())
+
+        _, entries = self.channels.get(channel_id, (None, ()))
+        return list(reversed(entries))
+
+    def sweep(self, now: float):
+        while self.channels:
+            channel_id = next(iter(self.channels))
+            last_deleted_at, _ = self.channels[channel_id]
+            if (
+                len(self.channels) <= self.max_channels
+                and now - last_deleted_at < self.idle_after
+            ):
+                break
+
+            del self.channels[channel_id]
+            self.metrics.incr("channels_dropped")
+
+        self.metrics.set("channels", len(self.channels))
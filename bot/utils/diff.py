@@ -0,0 +1,159 @@
+import typing
+
+
+def matching_blocks(
+    a: typing.Sequence,
+    b: typing.Sequence,
+    *,
+    max_edits: int,
+    replace_overflow: bool = True,
+):
+    """Finds blocks of equal items in two sequences
+
+    Returns (i, j, size) triples like difflib.SequenceMatcher.get_matching_blocks,
+    including the final dummy block. Common prefixes and suffixes are matched
+    directly, the rest is aligned with Myers' O((N+M)D) algorithm. If the
+    remainder needs more than `max_edits` edits it is treated as replaced, or
+    None is returned when `replace_overflow` is false.
+    """
+
+    a_end, b_end = len(a), len(b)
+
+    prefix = 0
+    while prefix < a_end and prefix < b_end and a[prefix] == b[prefix]:
+        prefix += 1
+
+    while a_end > prefix and b_end > prefix and a[a_end - 1] == b[b_end - 1]:
+        a_end -= 1
+        b_end -= 1
+
+    middle = shortest_edit_blocks(a[prefix:a_end], b[prefix:b_end], max_edits=max_edits)
+    if middle is None:
+        if not replace_overflow:
+            return None
+        middle = []
+
+    blocks = []
+    if prefix:
+        blocks.append((0, 0, prefix))
+
+    blocks.extend((prefix + i, prefix + j, size) for i, j, size in middle)
+
+    if a_end < len(a):
+        blocks.append((a_end, b_end, len(a) - a_end))
+
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def shortest_edit_blocks(a: typing.Sequence, b: typing.Sequence, *, max_edits: int):
+    n, m = len(a), len(b)
+    if not n or not m:
+        return []
+
+    furthest = {1: 0}
+    trace = []
+
+    for edits in range(min(n + m, max_edits) + 1):
+        trace.append(furthest.copy())
+
+        for k in range(-edits, edits + 1, 2):
+            if k == -edits or (k != edits and furthest[k - 1] < furthest[k + 1]):
+                x = furthest[k + 1]
+            else:
+                x = furthest[k - 1] + 1
+
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+
+            furthest[k] = x
+
+            if x >= n and y >= m:
+                return backtrack(trace, n, m)
+
+    return None
+
+
+def backtrack(trace: list, x: int, y: int):
+    blocks = []
+
+    for edits in range(len(trace) - 1, -1, -1):
+        furthest = trace[edits]
+        k = x - y
+
+        if k == -edits or (k != edits and furthest[k - 1] < furthest[k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+
+        previous_x = furthest[previous_k]
+        previous_y = previous_x - previous_k
+
+        size = 0
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            size += 1
+
+        if size:
+            blocks.append((x, y, size))
+
+        x, y = previous_x, previous_y
+
+    blocks.reverse()
+    return blocks
+
+
+def opcodes(blocks: typing.List[typing.Tuple[int, int, int]]):
+    """Same as difflib.SequenceMatcher.get_opcodes, for the given blocks"""
+
+    codes = []
+    i = j = 0
+
+    for ai, bj, size in blocks:
+        if i < ai and j < bj:
+            codes.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            codes.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            codes.append(("insert", i, ai, j, bj))
+
+        i, j = ai + size, bj + size
+        if size:
+            if codes and codes[-1][0] == "equal":
+                _, i1, _, j1, _ = codes.pop()
+                codes.append(("equal", i1, i, j1, j))
+            else:
+                codes.append(("equal", ai, i, bj, j))
+
+    return codes
+
+
+def grouped_opcodes(codes: list, n: int = 3):
+    """Same as difflib.SequenceMatcher.get_grouped_opcodes, for the given codes"""
+
+    if not codes:
+        codes = [("equal", 0, 1, 0, 1)]
+
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > n + n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+
+        group.append((tag, i1, i2, j1, j2))
+
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
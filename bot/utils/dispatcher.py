@@ -0,0 +1,103 @@
+import asyncio
+import collections
+import sys
+import traceback
+
+import discord
+from discord.ext import commands
+
+
+class LogDispatcher:
+    """Coalesces log embeds into as few messages per log channel as possible
+
+    Embeds are queued per channel and sent after a short window, packing up to
+    10 embeds into every message. Queues are bounded, entries beyond the bound
+    are counted and reported in a summary embed instead.
+    """
+
+    max_embeds = 10
+    max_embed_chars = 6000
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        *,
+        window: float = 1.0,
+        max_queued: int = 100,
+    ):
+        self.bot = bot
+        self.window = window
+        self.max_queued = max_queued
+        self.metrics = bot.metrics["log_dispatcher"]
+
+        self.queues = {}
+        self.dropped = collections.Counter()
+        self.tasks = {}
+
+    def send(self, channel: discord.TextChannel, embed: discord.Embed):
+        self.metrics.incr("embeds_logged")
+
+        queue = self.queues.setdefault(channel.id, collections.deque())
+        if len(queue) >= self.max_queued:
+            self.metrics.incr("embeds_dropped")
+            self.dropped[channel.id] += 1
+        else:
+            queue.append(embed)
+
+        if channel.id not in self.tasks:
+            self.tasks[channel.id] = self.bot.loop.create_task(self.drain(channel.id))
+
+    async def drain(self, channel_id: int):
+        try:
+            await asyncio.sleep(self.window)
+            await self.send_queued(channel_id)
+        finally:
+            del self.tasks[channel_id]
+
+    async def flush(self):
+        for channel_id in list(self.queues):
+            await self.send_queued(channel_id)
+
+    async def send_queued(self, channel_id: int):
+        queue = self.queues.get(channel_id)
+
+        while queue or self.dropped[channel_id]:
+            embeds = []
+            size = 0
+            while (
+                queue
+                and len(embeds) < self.max_embeds
+                and size + len(queue[0]) <= self.max_embed_chars
+            ):
+                size += len(queue[0])
+                embeds.append(queue.popleft())
+
+            if self.dropped[channel_id] and len(embeds) < self.max_embeds:
+                embeds.append(
+                    discord.Embed(
+                        description=f"**{self.dropped[channel_id]} more log entries"
+                        " were dropped because too many were queued**"
+                    )
+                )
+                del self.dropped[channel_id]
+
+            # A single embed over the size limit can never be sent
+            if not embeds:
+                queue.popleft()
+                self.metrics.incr("embeds_dropped")
+                continue
+
+            try:
+                await self.bot.http.request(
+                    discord.http.Route(
+                        "POST", "/channels/{channel_id}/messages", channel_id=channel_id
+                    ),
+                    json={"embeds": [embed.to_dict() for embed in embeds]},
+                )
+            except discord.HTTPException:
+                self.metrics.incr("messages_failed")
+                traceback.print_exc(file=sys.stderr)
+            else:
+                self.metrics.incr("messages_sent")
+
+        self.queues.pop(channel_id, None)
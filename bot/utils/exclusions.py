@@ -0,0 +1,38 @@
+import typing
+
+import discord
+
+
+class Exclusions:
+    """Channels, categories and roles of a guild whose messages are ignored"""
+
+    __slots__ = ("channel_ids", "category_ids", "role_ids")
+
+    def __init__(
+        self,
+        channel_ids: typing.Iterable[int] = (),
+        category_ids: typing.Iterable[int] = (),
+        role_ids: typing.Iterable[int] = (),
+    ):
+        self.channel_ids = frozenset(channel_ids)
+        self.category_ids = frozenset(category_ids)
+        self.role_ids = frozenset(role_ids)
+
+    def __bool__(self):
+        return bool(self.channel_ids or self.category_ids or self.role_ids)
+
+    def excludes(self, message: discord.Message):
+        return self.excludes_channel(message.channel) or self.excludes_roles(
+            role.id for role in getattr(message.author, "roles", ())
+        )
+
+    def excludes_channel(self, channel: discord.abc.Messageable):
+        if channel.id in self.channel_ids:
+            return True
+
+        return getattr(channel, "category_id", None) in self.category_ids
+
+    def excludes_roles(self, role_ids: typing.Iterable[int]):
+        return bool(self.role_ids) and any(
+            role_id in self.role_ids for role_id in role_ids
+        )
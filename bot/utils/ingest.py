@@ -0,0 +1,111 @@
+import asyncio
+import sys
+import traceback
+
+import discord
+from discord.ext import commands
+
+
+class MessageIngest:
+    """Write-behind buffer for newly created messages
+
+    Messages are kept in memory and written in batches, either when the
+    buffer reaches `max_rows` or when `flush` is called by the owner's timer.
+    Once `max_pending` messages are buffered, callers of `put` wait for a
+    flush to finish before their message is accepted.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        *,
+        max_rows: int = 500,
+        max_pending: int = 5000,
+    ):
+        self.bot = bot
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.metrics = bot.metrics["ingest"]
+
+        self.buffer = []
+        self.pending = set()
+        self.lock = asyncio.Lock()
+
+    def is_pending(self, message_id: int):
+        return message_id in self.pending
+
+    async def put(self, message: discord.Message):
+        while len(self.buffer) >= self.max_pending:
+            self.metrics.incr("backpressure_waits")
+            await self.flush()
+
+        self.buffer.append(
+            (
+                message.id,
+                message.channel.id,
+                message.guild.id,
+                message.author.id,
+                message.created_at,
+                message.content,
+            )
+        )
+        self.pending.add(message.id)
+
+        if len(self.buffer) >= self.max_rows:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            while self.buffer:
+                batch = self.buffer[: self.max_rows]
+                del self.buffer[: self.max_rows]
+
+                try:
+                    with self.metrics.time("flush"):
+                        await self.write(batch)
+                except Exception:
+                    self.metrics.incr("rows_dropped", len(batch))
+                    traceback.print_exc(file=sys.stderr)
+                else:
+                    self.metrics.incr("batches")
+                    self.metrics.incr("rows", len(batch))
+                finally:
+                    self.pending.difference_update(row[0] for row in batch)
+
+    async def write(self, batch: list):
+        (
+            message_ids,
+            channel_ids,
+            guild_ids,
+            author_ids,
+            created_ats,
+            contents,
+        ) = zip(*batch)
+
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO message_metadata (message_id, channel_id, guild_id, author_id)
+                    SELECT * FROM unnest($1::BIGINT[], $2::BIGINT[], $3::BIGINT[], $4::BIGINT[])
+                    ON CONFLICT DO NOTHING
+                    """,
+                    message_ids,
+                    channel_ids,
+                    guild_ids,
+                    author_ids,
+                )
+                # Search vectors are computed by the database as part of the
+                # batch, not on the event loop
+                await conn.execute(
+                    """
+                    INSERT INTO message_history (message_id, version, version_at, content, content_tsv)
+                    SELECT message_id, 0, version_at, content, to_tsvector('simple', content)
+                    FROM unnest($1::BIGINT[], $2::TIMESTAMP[], $3::TEXT[])
+                    AS batch (message_id, version_at, content)
+                    ON CONFLICT DO NOTHING
+                    """,
+                    message_ids,
+                    created_ats,
+                    contents,
+                )
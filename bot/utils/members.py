@@ -0,0 +1,39 @@
+import discord
+
+
+class MemberIndex:
+    """Reverse index from user IDs to the IDs of guilds they share with the bot"""
+
+    def __init__(self):
+        self.guilds = {}
+
+    def __len__(self):
+        return len(self.guilds)
+
+    def guilds_for(self, user_id: int):
+        return self.guilds.get(user_id, frozenset())
+
+    def add(self, guild_id: int, user_id: int):
+        self.guilds.setdefault(user_id, set()).add(guild_id)
+
+    def remove(self, guild_id: int, user_id: int):
+        guild_ids = self.guilds.get(user_id)
+        if guild_ids is None:
+            return
+
+        guild_ids.discard(guild_id)
+        if not guild_ids:
+            del self.guilds[user_id]
+
+    def add_guild(self, guild: discord.Guild):
+        for member in guild.members:
+            self.add(guild.id, member.id)
+
+    def remove_guild(self, guild: discord.Guild):
+        for member in guild.members:
+            self.remove(guild.id, member.id)
+
+    def rebuild(self, guilds: list):
+        self.guilds = {}
+        for guild in guilds:
+            self.add_guild(guild)
@@ -0,0 +1,42 @@
+import collections
+import contextlib
+import time
+
+
+class Metrics:
+    """Counters and timings for a single component of the bot"""
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.timings = {}
+
+    def incr(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def set(self, name: str, value):
+        self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        count, total, highest = self.timings.get(name, (0, 0.0, 0.0))
+        self.timings[name] = (count + 1, total + seconds, max(highest, seconds))
+
+    @contextlib.contextmanager
+    def time(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self):
+        lines = [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        lines.extend(f"{name}: {value}" for name, value in sorted(self.gauges.items()))
+
+        for name, (count, total, highest) in sorted(self.timings.items()):
+            lines.append(
+                f"{name}: avg {total / count * 1000:.2f}ms,"
+                f" max {highest * 1000:.2f}ms over {count}"
+            )
+
+        return "\n".join(lines)
@@ -11,16 +11,30 @@ action_last = "\N{BLACK RIGHT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}"
 
 
 class FieldPaginator:
+    """Pages embed fields, navigated with reactions by the owner
+
+    If `fetch_more` is given it's awaited whenever the owner goes past the last
+    page, to add more fields. It returns False once there's nothing left, so
+    results can be loaded a page at a time instead of all at once.
+    """
+
     def __init__(
-        self, bot: commands.Bot, *, base_embed: discord.Embed = discord.Embed(),
+        self,
+        bot: commands.Bot,
+        *,
+        base_embed: discord.Embed = discord.Embed(),
+        fields_per_page: int = 25,
+        fetch_more: typing.Optional[typing.Callable[[], typing.Awaitable[bool]]] = None,
     ):
         self.bot = bot
         self.base_embed = base_embed.copy()
+        self.fields_per_page = min(fields_per_page, 25 - len(self.base_embed.fields))
+        self.fetch_more = fetch_more
         self.pages = [[]]
 
     def add_field(self, *, name: str, value: str, inline: bool = True):
         last_page = self.pages[-1]
-        if len(last_page) >= 25 - len(self.base_embed.fields):
+        if len(last_page) >= self.fields_per_page:
             last_page = []
             self.pages.append(last_page)
 
@@ -51,7 +65,7 @@ class FieldPaginator:
     ):
         message = await target.send(embed=self.get_embed_for_page(0))
 
-        if len(self.pages) <= 1:
+        if len(self.pages) <= 1 and not self.fetch_more:
             return message
 
         self.bot.loop.create_task(self.loop(message=message, owner=owner))
@@ -70,7 +84,13 @@ class FieldPaginator:
         page = 0
 
         async def set_page(index):
-            page = max(0, min(len(self.pages), index))
+            nonlocal page
+
+            if index >= len(self.pages) and self.fetch_more:
+                if not await self.fetch_more():
+                    self.fetch_more = None
+
+            page = max(0, min(len(self.pages) - 1, index))
             await message.edit(embed=self.get_embed_for_page(page))
 
         actions = {
@@ -104,6 +124,6 @@ class FieldPaginator:
         except (asyncio.TimeoutError, asyncio.CancelledError):
             for emoji in actions.keys():
                 try:
-                    await self.message.remove_reaction(emoji, self.bot.user)
+                    await message.remove_reaction(emoji, self.bot.user)
                 except (discord.Forbidden, discord.NotFound):
                     pass
@@ -0,0 +1,39 @@
+import typing
+
+
+class PrefixMatcher:
+    """First characters a message has to start with to possibly be a command
+
+    Mentions always work as prefix, so "<" is always included. Guilds are
+    unknown until their prefix is set, callers load it and call `set_prefix`.
+    """
+
+    mention_start = "<"
+
+    def __init__(self):
+        self.default = frozenset(self.mention_start)
+        self.guilds = {}
+
+    def might_be_command(
+        self, guild_id: typing.Optional[int], content: str
+    ) -> typing.Optional[bool]:
+        if not content:
+            return False
+
+        if guild_id is None:
+            starts = self.default
+        else:
+            starts = self.guilds.get(guild_id)
+            if starts is None:
+                return None
+
+        return content[0] in starts
+
+    def set_prefix(self, guild_id: int, prefix: typing.Optional[str]):
+        if prefix:
+            self.guilds[guild_id] = self.default | {prefix[0]}
+        else:
+            self.guilds[guild_id] = self.default
+
+    def invalidate(self, guild_id: int):
+        self.guilds.pop(guild_id, None)
@@ -0,0 +1,69 @@
+import asyncio
+import functools
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bot.utils import diff_message
+from discord.ext import commands
+
+
+class RenderPool:
+    """Renders message diffs for logs without blocking the event loop
+
+    Inputs up to `offload_chars` characters are rendered inline, larger ones in
+    a worker process. If a worker doesn't finish within `timeout` seconds, or
+    the pool is unusable, `fallback` is returned instead of the diff.
+    """
+
+    fallback = "*Content changed, the difference was too large to show*"
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        *,
+        workers: int = 2,
+        offload_chars: int = 4000,
+        timeout: float = 2.0,
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.offload_chars = offload_chars
+        self.timeout = timeout
+        self.metrics = bot.metrics["render"]
+
+        self.executor = None
+
+    async def diff_message(self, a: str, b: str, **kwargs):
+        if len(a) + len(b) <= self.offload_chars or not self.workers:
+            self.metrics.incr("inline")
+            with self.metrics.time("inline"):
+                return diff_message(a, b, **kwargs)
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+
+        self.metrics.incr("offloaded")
+        try:
+            with self.metrics.time("offloaded"):
+                return await asyncio.wait_for(
+                    self.bot.loop.run_in_executor(
+                        self.executor, functools.partial(diff_message, a, b, **kwargs)
+                    ),
+                    self.timeout,
+                )
+        except asyncio.TimeoutError:
+            # The worker keeps running until it's done, the pool can't cancel it
+            self.metrics.incr("timeouts")
+        except BrokenProcessPool:
+            self.metrics.incr("failures")
+            traceback.print_exc(file=sys.stderr)
+            self.executor = None
+
+        return self.fallback
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
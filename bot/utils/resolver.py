@@ -0,0 +1,68 @@
+import asyncio
+import typing
+
+import discord
+import lru
+from discord.ext import commands
+
+
+class UserResolver:
+    """Resolves user IDs to members or users with as few API calls as possible
+
+    Members and users from the gateway cache are preferred, then users fetched
+    earlier that have not expired yet. Unknown IDs are remembered as well, and
+    concurrent lookups of the same ID share a single request.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        *,
+        max_users: int = 4096,
+        ttl: float = 3600.0,
+        negative_ttl: float = 300.0,
+    ):
+        self.bot = bot
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.metrics = bot.metrics["users"]
+
+        self.cache = lru.LRU(max_users)
+        self.fetches = {}
+
+    async def resolve(
+        self, user_id: int, *, guild: typing.Optional[discord.Guild] = None
+    ) -> typing.Optional[typing.Union[discord.Member, discord.User]]:
+        if guild and (member := guild.get_member(user_id)):
+            self.metrics.incr("member_hits")
+            return member
+
+        if user := self.bot.get_user(user_id):
+            self.metrics.incr("user_hits")
+            return user
+
+        cached = self.cache.get(user_id)
+        if cached and cached[0] > self.bot.loop.time():
+            self.metrics.incr("hits" if cached[1] else "negative_hits")
+            return cached[1]
+
+        fetch = self.fetches.get(user_id)
+        if fetch is None:
+            self.metrics.incr("misses")
+            fetch = self.bot.loop.create_task(self.fetch(user_id))
+            fetch.add_done_callback(lambda _: self.fetches.pop(user_id, None))
+            self.fetches[user_id] = fetch
+        else:
+            self.metrics.incr("coalesced")
+
+        return await asyncio.shield(fetch)
+
+    async def fetch(self, user_id: int):
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            self.cache[user_id] = (self.bot.loop.time() + self.negative_ttl, None)
+            return None
+
+        self.cache[user_id] = (self.bot.loop.time() + self.ttl, user)
+        return user
@@ -0,0 +1,55 @@
+import typing
+import zlib
+
+# Every version that is a multiple of this is stored as full text, so
+# rebuilding any version never needs more rows than this
+keyframe_interval = 8
+
+
+def keyframe(version: int):
+    return version - version % keyframe_interval
+
+
+def resolve_version(version: int, version_count: int):
+    return version + version_count if version < 0 else version
+
+
+def encode_version(
+    previous: typing.Optional[str], content: str, version: int, *, delta: bool
+):
+    """Returns the (content, content_delta) pair to store for a message version
+
+    Deltas are raw deflate streams of the new content using the previous
+    version as preset dictionary, so unchanged text costs next to nothing.
+    """
+
+    if not delta or not previous or version % keyframe_interval == 0:
+        return content, None
+
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=previous.encode())
+    return None, compressor.compress(content.encode()) + compressor.flush()
+
+
+def decode_version(previous: str, content_delta: bytes):
+    decompressor = zlib.decompressobj(-15, zdict=previous.encode())
+    return (decompressor.decompress(content_delta) + decompressor.flush()).decode()
+
+
+def decode_versions(rows: typing.Iterable[typing.Mapping]):
+    """Rebuilds content for rows with version, content and content_delta keys
+
+    Rows have to be sorted by version, delta rows are only decoded when the
+    version right before them is part of the rows as well.
+    """
+
+    contents = {}
+
+    for row in rows:
+        if row["content_delta"] is None:
+            contents[row["version"]] = row["content"]
+        elif row["version"] - 1 in contents:
+            contents[row["version"]] = decode_version(
+                contents[row["version"] - 1], row["content_delta"]
+            )
+
+    return contents
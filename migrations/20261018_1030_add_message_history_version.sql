@@ -0,0 +1,35 @@
+ALTER TABLE message_history
+ADD version INT;
+
+UPDATE message_history
+SET version = numbered.version
+FROM (
+  SELECT
+    message_id,
+    version_at,
+    ROW_NUMBER() OVER (PARTITION BY message_id ORDER BY version_at) - 1 AS version
+  FROM message_history
+) numbered
+WHERE message_history.message_id = numbered.message_id
+AND message_history.version_at = numbered.version_at;
+
+ALTER TABLE message_history
+ALTER version SET NOT NULL;
+
+ALTER TABLE message_history
+DROP CONSTRAINT message_history_pkey;
+
+ALTER TABLE message_history
+ADD PRIMARY KEY (message_id, version);
+
+ALTER TABLE message_metadata
+ADD version_count INT NOT NULL DEFAULT 1;
+
+UPDATE message_metadata
+SET version_count = counted.version_count
+FROM (
+  SELECT message_id, COUNT(*) AS version_count
+  FROM message_history
+  GROUP BY message_id
+) counted
+WHERE message_metadata.message_id = counted.message_id;
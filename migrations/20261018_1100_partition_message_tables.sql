@@ -0,0 +1,85 @@
+ALTER TABLE guild_config
+ADD message_retention_days INT;
+
+ALTER TABLE message_history
+RENAME TO message_history_unpartitioned;
+
+ALTER TABLE message_history_unpartitioned
+RENAME CONSTRAINT message_history_pkey TO message_history_unpartitioned_pkey;
+
+ALTER TABLE message_metadata
+RENAME TO message_metadata_unpartitioned;
+
+ALTER TABLE message_metadata_unpartitioned
+RENAME CONSTRAINT message_metadata_pkey TO message_metadata_unpartitioned_pkey;
+
+CREATE TABLE message_metadata (
+  message_id BIGINT NOT NULL PRIMARY KEY,
+  channel_id BIGINT NOT NULL,
+  guild_id BIGINT NOT NULL REFERENCES guild_config (guild_id),
+  author_id BIGINT NOT NULL,
+  version_count INT NOT NULL DEFAULT 1
+) PARTITION BY RANGE (message_id);
+
+CREATE INDEX ON message_metadata (guild_id, message_id);
+
+CREATE TABLE message_history (
+  message_id BIGINT NOT NULL REFERENCES message_metadata (message_id),
+  version INT NOT NULL,
+  version_at TIMESTAMP NOT NULL,
+  content TEXT,
+  PRIMARY KEY (message_id, version)
+) PARTITION BY RANGE (message_id);
+
+-- Partitions cover one calendar month (UTC) of snowflakes each and are named
+-- after it, the retention task relies on that naming to create and drop them
+DO $$
+DECLARE
+  month TIMESTAMP;
+  lower_bound BIGINT;
+  upper_bound BIGINT;
+BEGIN
+  SELECT date_trunc(
+    'month',
+    COALESCE(
+      to_timestamp(((MIN(message_id) >> 22) + 1420070400000) / 1000.0) AT TIME ZONE 'UTC',
+      NOW() AT TIME ZONE 'UTC'
+    )
+  )
+  INTO month
+  FROM message_metadata_unpartitioned;
+
+  WHILE month < date_trunc('month', NOW() AT TIME ZONE 'UTC') + interval '3 months' LOOP
+    lower_bound := ((EXTRACT(EPOCH FROM month) * 1000)::BIGINT - 1420070400000) << 22;
+    upper_bound := (
+      (EXTRACT(EPOCH FROM month + interval '1 month') * 1000)::BIGINT - 1420070400000
+    ) << 22;
+
+    EXECUTE format(
+      'CREATE TABLE %I PARTITION OF message_metadata FOR VALUES FROM (%s) TO (%s)',
+      'message_metadata_' || to_char(month, 'YYYYMM'),
+      lower_bound,
+      upper_bound
+    );
+    EXECUTE format(
+      'CREATE TABLE %I PARTITION OF message_history FOR VALUES FROM (%s) TO (%s)',
+      'message_history_' || to_char(month, 'YYYYMM'),
+      lower_bound,
+      upper_bound
+    );
+
+    month := month + interval '1 month';
+  END LOOP;
+END $$;
+
+INSERT INTO message_metadata (message_id, channel_id, guild_id, author_id, version_count)
+SELECT message_id, channel_id, guild_id, author_id, version_count
+FROM message_metadata_unpartitioned;
+
+INSERT INTO message_history (message_id, version, version_at, content)
+SELECT message_id, version, version_at, content
+FROM message_history_unpartitioned;
+
+DROP TABLE message_history_unpartitioned;
+
+DROP TABLE message_metadata_unpartitioned;
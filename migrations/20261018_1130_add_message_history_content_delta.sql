@@ -0,0 +1,2 @@
+ALTER TABLE message_history
+ADD content_delta BYTEA;
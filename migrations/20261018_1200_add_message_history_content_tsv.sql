@@ -0,0 +1,10 @@
+-- Filled in by the bot when a version is stored, delta encoded versions have
+-- no content to compute it from in SQL
+ALTER TABLE message_history
+ADD content_tsv TSVECTOR;
+
+UPDATE message_history
+SET content_tsv = to_tsvector('simple', content)
+WHERE content IS NOT NULL;
+
+CREATE INDEX ON message_history USING GIN (content_tsv) WITH (fastupdate = on);
@@ -0,0 +1,10 @@
+CREATE TABLE message_activity_daily (
+  guild_id BIGINT NOT NULL,
+  day DATE NOT NULL,
+  channel_id BIGINT NOT NULL,
+  author_id BIGINT NOT NULL,
+  messages INT NOT NULL DEFAULT 0,
+  edits INT NOT NULL DEFAULT 0,
+  deletes INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (guild_id, day, channel_id, author_id)
+);
@@ -0,0 +1,5 @@
+-- Message IDs are snowflakes, so ranges on them are time windows and these
+-- cover "what did this user / channel send between then and now"
+CREATE INDEX ON message_metadata (author_id, message_id);
+
+CREATE INDEX ON message_metadata (channel_id, message_id);
@@ -0,0 +1,8 @@
+ALTER TABLE guild_config
+ADD excluded_channel_ids BIGINT[];
+
+ALTER TABLE guild_config
+ADD excluded_category_ids BIGINT[];
+
+ALTER TABLE guild_config
+ADD excluded_role_ids BIGINT[];